@@ -0,0 +1,158 @@
+"""
+Suppression en cascade et archivage des events.
+
+Toutes les opérations sont ensemblistes (un DELETE / INSERT ... SELECT par table),
+quel que soit le nombre de participants.
+
+L'archivage déplace les events antérieurs à une date, avec toutes leurs lignes
+liées, dans un fichier SQLite séparé (ARCHIVE_DATABASE_PATH) attaché le temps de
+l'opération : la base principale et ses index restent petits, et l'archive reste
+consultable (mêmes tables, mêmes colonnes).
+"""
+import os
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.cache_bus import cache_bus
+from app.db import after_commit, engine
+from app import models
+from app.scan_store import scan_store
+
+ARCHIVE_DATABASE_PATH = os.getenv("ARCHIVE_DATABASE_PATH", "./archive.db")
+
+# tables rattachées à un event par une colonne event_id
+EVENT_CHILD_TABLES = [
+    models.Ticket.__table__,
+    models.EmailDelivery.__table__,
+    models.Participant.__table__,
+    models.EventAdmin.__table__,
+    models.ScanAttempt.__table__,
+    models.ScanRollup.__table__,
+    models.EventQuota.__table__,
+]
+# tables recopiées dans l'archive (les mails envoyés ne sont pas conservés)
+ARCHIVED_TABLES = [
+    models.Event.__table__,
+    models.EventAdmin.__table__,
+    models.Participant.__table__,
+    models.Ticket.__table__,
+    models.ScanAttempt.__table__,
+    models.ScanRollup.__table__,
+]
+
+
+def delete_events(db: Session, event_ids: List[int]) -> Dict[str, int]:
+    """
+    Supprime les events et toutes leurs lignes liées (sans commit). Les compteurs de
+    scan_store ne sont oubliés qu'au commit de `db` : un rollback les laisse intacts.
+    """
+    counts = {}
+    for table in EVENT_CHILD_TABLES:
+        counts[table.name] = db.execute(
+            delete(table).where(table.c.event_id.in_(event_ids))
+        ).rowcount
+    counts["events"] = db.execute(
+        delete(models.Event.__table__).where(models.Event.__table__.c.id.in_(event_ids))
+    ).rowcount
+
+    cache_bus.bump(db, "events")
+    event_ids = list(event_ids)
+    after_commit(db, lambda: _forget_events(event_ids))
+    return counts
+
+
+def _forget_events(event_ids: List[int]) -> None:
+    for event_id in event_ids:
+        scan_store.forget_event(event_id)
+
+
+def _columns(conn: Connection, schema: str, table: str) -> List[str]:
+    return [row[1] for row in conn.exec_driver_sql(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _prepare_archive_table(conn: Connection, table: str) -> List[str]:
+    """Crée (ou complète) la table dans l'archive ; renvoie les colonnes à recopier."""
+    main_columns = _columns(conn, "main", table)
+    archive_columns = _columns(conn, "archive", table)
+    if not archive_columns:
+        conn.exec_driver_sql(
+            f"CREATE TABLE archive.{table} AS SELECT * FROM main.{table} WHERE 0"
+        )
+        key = "id" if table == "events" else "event_id"
+        conn.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS archive.ix_archive_{table}_{key} ON {table} ({key})"
+        )
+    else:
+        # colonnes ajoutées aux modèles depuis le dernier archivage
+        for column in main_columns:
+            if column not in archive_columns:
+                conn.exec_driver_sql(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+    return main_columns
+
+
+def archive_events_before(cutoff: datetime, path: str = ARCHIVE_DATABASE_PATH) -> Dict[str, int]:
+    """Déplace dans l'archive les events dont la date est antérieure à `cutoff`."""
+    # les dates sont stockées en texte ISO ("AAAA-MM-JJ HH:MM:SS.ffffff")
+    cutoff = cutoff.isoformat(" ")
+    with engine.connect() as conn:
+        # ATTACH / DETACH sont interdits dans une transaction
+        conn.exec_driver_sql("ATTACH DATABASE ? AS archive", (path,))
+        conn.commit()
+        try:
+            with conn.begin():
+                event_ids = [
+                    row[0]
+                    for row in conn.exec_driver_sql(
+                        "SELECT id FROM main.events WHERE date < ?", (cutoff,)
+                    )
+                ]
+                if not event_ids:
+                    return {"events": 0}
+
+                conn.exec_driver_sql("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)")
+                conn.exec_driver_sql("DELETE FROM temp.archive_batch")
+                conn.exec_driver_sql(
+                    "INSERT INTO temp.archive_batch (id) SELECT id FROM main.events WHERE date < ?",
+                    (cutoff,),
+                )
+
+                counts = {}
+                for table in ARCHIVED_TABLES:
+                    columns = ", ".join(_prepare_archive_table(conn, table.name))
+                    key = "id" if table.name == "events" else "event_id"
+                    counts[table.name] = conn.exec_driver_sql(
+                        f"INSERT INTO archive.{table.name} ({columns}) "
+                        f"SELECT {columns} FROM main.{table.name} "
+                        f"WHERE {key} IN (SELECT id FROM temp.archive_batch)"
+                    ).rowcount
+
+                with Session(bind=conn) as db:
+                    delete_events(db, event_ids)
+                    db.flush()
+            # commit fait par conn.begin(), pas par la Session : son after_commit ne part pas
+            _forget_events(event_ids)
+            return counts
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql("DETACH DATABASE archive")
+            conn.commit()
+
+
+_archive_engine = None
+
+
+def get_archive_engine():
+    """Engine en lecture sur le fichier d'archive (None s'il n'existe pas encore)."""
+    global _archive_engine
+    if not os.path.exists(ARCHIVE_DATABASE_PATH):
+        return None
+    if _archive_engine is None:
+        _archive_engine = create_engine(
+            f"sqlite:///{ARCHIVE_DATABASE_PATH}",
+            connect_args={"check_same_thread": False},
+        )
+    return _archive_engine
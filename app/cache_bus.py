@@ -0,0 +1,161 @@
+"""
+Caches locaux au process, cohérents entre workers uvicorn (même machine, même
+fichier SQLite), sans autre service que la base.
+
+    - table `cache_versions` : un compteur par nom de cache ("events", "users"...).
+      Toute écriture qui rend un cache périmé appelle `bump(conn, "events")`
+      DANS sa transaction : l'invalidation est commitée en même temps que la donnée ;
+    - chaque worker garde une connexion SQLite dédiée et lit `PRAGMA data_version`,
+      qui change dès qu'une AUTRE connexion a commité dans le fichier. Tant qu'il ne
+      change pas, aucune lecture de la table (coût : quelques µs, au plus une fois
+      toutes les CACHE_BUS_POLL_MS ms) ;
+    - `LocalCache` vide son contenu quand la version de son nom a changé, et ses
+      entrées expirent de toute façon après CACHE_TTL_SECONDS (filet de sécurité
+      pour les modifications faites à la main en base).
+
+Un worker voit donc l'invalidation d'un autre au plus CACHE_BUS_POLL_MS ms après
+le commit ; dans le worker qui écrit, elle est immédiate.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app.db import DATABASE_URL
+
+CACHE_BUS_POLL_MS = int(os.getenv("CACHE_BUS_POLL_MS", "50"))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "60"))
+
+_BUMP_SQL = text(
+    "INSERT INTO cache_versions (name, version) VALUES (:name, 1) "
+    "ON CONFLICT (name) DO UPDATE SET version = version + 1"
+)
+
+_MISSING = object()
+
+
+class CacheBus:
+    def __init__(self, database_path: Optional[str] = None, poll_ms: int = CACHE_BUS_POLL_MS):
+        self.database_path = database_path or make_url(DATABASE_URL).database
+        self.poll_interval = poll_ms / 1000
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._data_version: Optional[int] = None
+        self._versions: Dict[str, int] = {}
+        # incrémenté par les bump() de ce process : invalidation locale immédiate
+        self._local: Dict[str, int] = {}
+        self._last_poll = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # autocommit : la connexion ne garde jamais de transaction de lecture ouverte
+            self._conn = sqlite3.connect(self.database_path, isolation_level=None, check_same_thread=False)
+        return self._conn
+
+    def _refresh(self) -> None:
+        conn = self._connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        try:
+            self._versions = dict(conn.execute("SELECT name, version FROM cache_versions"))
+        except sqlite3.OperationalError:
+            # table pas encore créée (tout premier démarrage)
+            self._versions = {}
+        self._data_version = data_version
+
+    def version(self, name: str) -> tuple:
+        """Version courante d'un cache : change à chaque bump(), local ou venant d'un autre worker."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_poll >= self.poll_interval:
+                self._refresh()
+                self._last_poll = now
+            return self._versions.get(name, 0), self._local.get(name, 0)
+
+    def bump(self, conn, *names: str) -> None:
+        """
+        Invalide les caches `names` dans tous les workers.
+        `conn` : Session ou Connection SQLAlchemy dont la transaction contient l'écriture.
+        """
+        for name in names:
+            conn.execute(_BUMP_SQL, {"name": name})
+        with self._lock:
+            for name in names:
+                self._local[name] = self._local.get(name, 0) + 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._data_version = None
+
+
+cache_bus = CacheBus()
+
+
+class LocalCache:
+    """Cache LRU propre au worker, vidé quand la version de `name` change sur le bus."""
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1024,
+        ttl: float = CACHE_TTL_SECONDS,
+        bus: CacheBus = cache_bus,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bus = bus
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._version: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self) -> tuple:
+        """À lire avant la requête en base, puis à passer à set()."""
+        return self.bus.version(self.name)
+
+    def _check_version(self) -> tuple:
+        version = self.bus.version(self.name)
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+        return version
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, version: Optional[tuple] = None) -> None:
+        """
+        `version` : valeur de `bus.version(name)` lue AVANT la requête en base, pour
+        ne pas mémoriser une donnée lue avant une invalidation survenue entre-temps.
+        """
+        with self._lock:
+            current = self._check_version()
+            if version is not None and version != current:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -1,5 +1,10 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from typing import Callable
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.schema import CreateIndex
+
+from app.tracing import span
 
 DATABASE_URL = 'sqlite:///./app.db'
 engine = create_engine(DATABASE_URL, connect_args={'check_same_thread': False})
@@ -7,8 +12,54 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 def get_db():
+    """
+    Session de la requête (unit of work), partagée par get_current_user et la route.
+
+    À déclarer avec `Depends(get_db, scope="function")` : la sortie s'exécute après
+    la sérialisation de la réponse mais avant son envoi. Un seul commit en fin de
+    requête (les routes font `db.flush()` si elles ont besoin des ids), rollback si
+    la route lève une exception. La Session n'emprunte une connexion au pool qu'à
+    sa première requête SQL : une requête refusée avant (token invalide, réponse
+    en cache) ne touche pas à la base.
+    """
     db = SessionLocal()
     try:
         yield db
+        if db.in_transaction():
+            # flush des objets en attente + COMMIT (attente du verrou d'écriture SQLite, fsync)
+            with span("db.commit"):
+                db.commit()
+    except BaseException:
+        with span("db.rollback"):
+            db.rollback()
+        raise
     finally:
         db.close()
+
+
+def after_commit(db: Session, callback: Callable[[], None]) -> None:
+    """Appelle callback() une fois la transaction commitée (réveil d'un thread, cache...)."""
+    event.listen(db, "after_commit", lambda session: callback(), once=True)
+
+
+def ensure_schema() -> None:
+    """
+    Complète une base existante : create_all ne crée que les tables manquantes,
+    pas les colonnes ni les index ajoutés ensuite aux modèles.
+    (Les nouvelles colonnes doivent donc être nullable.)
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+            for index in table.indexes:
+                # IF NOT EXISTS : les index sur expression (lower(email)...) ne sont pas relus par l'inspecteur
+                conn.execute(CreateIndex(index, if_not_exists=True))
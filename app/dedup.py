@@ -0,0 +1,274 @@
+"""
+Détection des doublons probables (annuaire des étudiants, participants d'un event).
+
+Une même personne apparaît sous plusieurs formes : casse, accents, prénom et nom
+inversés, alias d'email (prenom.nom+bde@gmail.com, googlemail.com, autre domaine).
+
+    1. normalisation : noms sans accents ni ponctuation, en minuscules, mots triés ;
+       email en minuscules, sans "+étiquette", sans les points pour gmail ;
+    2. blocage : seules les fiches qui partagent une clé sont comparées (même email
+       normalisé, ou mêmes 3 premières lettres de chaque mot du nom), jamais toutes
+       les paires ;
+    3. score de 0 à 1 de chaque paire candidate : 1 si l'email normalisé est le même,
+       sinon similarité du nom, corrigée par celle de la partie locale de l'email ;
+       sans indice sur l'email (partie locale différente ou absente), 0 : un nom
+       proche seul ne fait pas un doublon (homonymes, jean.martin@... / jm2@...).
+
+Les deux clés de blocage sont aussi stockées en base (colonnes `dedup_email` et
+`dedup_block`, indexées, remplies à chaque INSERT / UPDATE) : la vérification à la
+création d'une fiche est une requête indexée, sans parcours de table.
+"""
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, event, or_, select, update
+
+from app import models
+
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+# bloc plus gros (nom très courant) : comparé seulement entre voisins dans l'ordre alphabétique
+DEDUP_MAX_BLOCK = 200
+DEDUP_WINDOW = 20
+
+_GMAIL_DOMAINS = {"gmail.com", "googlemail.com"}
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize_name(value: Optional[str]) -> str:
+    """'  Éloïse-Marie  DUPONT ' -> 'eloise marie dupont'"""
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return " ".join(word for word in _SEPARATORS.split(value.casefold()) if word)
+
+
+def normalize_email(value: Optional[str]) -> str:
+    """'Jean.Dupont+BDE@GoogleMail.com' -> 'jeandupont@gmail.com'"""
+    if not value:
+        return ""
+    value = value.strip().lower()
+    if "@" not in value:
+        return value
+    local, domain = value.rsplit("@", 1)
+    local = local.split("+", 1)[0]
+    if domain in _GMAIL_DOMAINS:
+        local, domain = local.replace(".", ""), "gmail.com"
+    return f"{local}@{domain}"
+
+
+class Person:
+    """Fiche normalisée (étudiant ou participant)."""
+
+    __slots__ = ("id", "first_name", "last_name", "email", "name", "email_key", "local", "block")
+
+    def __init__(self, id, first_name, last_name, email):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.email = email
+        # mots triés : "Dupont Jean" et "Jean Dupont" donnent la même clé
+        words = sorted(normalize_name(f"{first_name or ''} {last_name or ''}").split())
+        self.name = " ".join(words)
+        self.block = "|".join(word[:3] for word in words)
+        self.email_key = normalize_email(email)
+        # partie locale sans séparateurs : jean.dupont@enpc.fr ~ jean_dupont@gmail.com
+        self.local = re.sub(r"[^a-z]", "", self.email_key.split("@", 1)[0])
+
+
+def dedup_keys(first_name: Optional[str], last_name: Optional[str], email: Optional[str]) -> dict:
+    """Valeurs des colonnes dedup_email / dedup_block d'une fiche."""
+    person = Person(None, first_name, last_name, email)
+    return {"dedup_email": person.email_key or None, "dedup_block": person.block}
+
+
+def score(a: Person, b: Person) -> Tuple[float, List[str]]:
+    """(score de 0 à 1, raisons) pour une paire de fiches."""
+    if a.email_key and a.email_key == b.email_key:
+        return 1.0, ["email"]
+    if not (a.local and b.local):
+        return 0.0, []
+    local = SequenceMatcher(None, a.local, b.local).ratio()
+    if local < DEDUP_THRESHOLD:
+        return 0.0, []
+    name = SequenceMatcher(None, a.name, b.name).ratio()
+    reasons = ["nom", "alias email"] if name >= DEDUP_THRESHOLD else ["alias email"]
+    return 0.85 * name + 0.15 * local, reasons
+
+
+def _candidate_pairs(people: List[Person]) -> Iterable[Tuple[Person, Person]]:
+    blocks: Dict[str, List[Person]] = defaultdict(list)
+    for person in people:
+        if person.email_key:
+            blocks["@" + person.email_key].append(person)
+        if person.block:
+            blocks[person.block].append(person)
+
+    seen = set()
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        if len(members) > DEDUP_MAX_BLOCK:
+            members = sorted(members, key=lambda p: (p.name, p.email_key))
+            window = DEDUP_WINDOW
+        else:
+            window = len(members)
+        for i, a in enumerate(members):
+            for b in members[i + 1:i + 1 + window]:
+                key = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+                if a.id == b.id or key in seen:
+                    continue
+                seen.add(key)
+                yield a, b
+
+
+def find_duplicates(people: List[Person], threshold: float = DEDUP_THRESHOLD) -> dict:
+    """
+    Rapport de doublons : groupes de fiches reliées par une paire au-dessus du seuil
+    (union-find : A~B et B~C donnent un seul groupe A, B, C).
+    """
+    parent = {}
+
+    def find(x):
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    by_id = {p.id: p for p in people}
+    best: Dict[Tuple[int, int], Tuple[float, List[str]]] = {}
+    compared = 0
+    for a, b in _candidate_pairs(people):
+        compared += 1
+        value, reasons = score(a, b)
+        if value >= threshold:
+            best[(a.id, b.id)] = (value, reasons)
+            parent[find(a.id)] = find(b.id)
+
+    groups: Dict[int, dict] = {}
+    for (a, b), (value, reasons) in best.items():
+        group = groups.setdefault(find(a), {"score": 0.0, "reasons": set(), "ids": set()})
+        group["score"] = max(group["score"], value)
+        group["reasons"].update(reasons)
+        group["ids"].update((a, b))
+
+    result = [
+        {
+            "score": round(group["score"], 3),
+            "reasons": sorted(group["reasons"]),
+            "members": [_member(by_id[i]) for i in sorted(group["ids"])],
+        }
+        for group in groups.values()
+    ]
+    result.sort(key=lambda g: (-g["score"], g["members"][0]["id"]))
+    return {"scanned": len(people), "pairs_compared": compared, "groups": result}
+
+
+def _member(person: Person, value: Optional[float] = None) -> dict:
+    member = {
+        "id": person.id,
+        "first_name": person.first_name,
+        "last_name": person.last_name,
+        "email": person.email,
+    }
+    if value is not None:
+        member["score"] = round(value, 3)
+    return member
+
+
+def load_people(db, model, *filters) -> List[Person]:
+    """Toutes les fiches de `model` (Student ou Participant) qui vérifient `filters`."""
+    rows = db.execute(
+        select(model.id, model.first_name, model.last_name, model.email).where(*filters)
+    )
+    return [Person(*row) for row in rows]
+
+
+def find_matches(db, model, people: List[Person], *filters, threshold: float = DEDUP_THRESHOLD) -> List[List[dict]]:
+    """
+    Pour chaque fiche de `people`, les fiches de `model` en base qui lui ressemblent,
+    par score décroissant. Une seule requête indexée (clés de blocage) pour tout le
+    lot. Les fiches de `people` peuvent être déjà flushées (elles ne se trouvent pas
+    elles-mêmes) ou pas encore insérées (id None).
+    """
+    blocks = {p.block for p in people if p.block}
+    emails = {p.email_key for p in people if p.email_key}
+    keys = []
+    if blocks:
+        keys.append(model.dedup_block.in_(blocks))
+    if emails:
+        keys.append(model.dedup_email.in_(emails))
+    if not keys:
+        return [[] for _ in people]
+
+    by_key: Dict[str, List[Person]] = defaultdict(list)
+    for row in db.execute(
+        select(model.id, model.first_name, model.last_name, model.email).where(*filters, or_(*keys))
+    ):
+        other = Person(*row)
+        by_key[other.block].append(other)
+        if other.email_key:
+            by_key["@" + other.email_key].append(other)
+
+    matches = []
+    for person in people:
+        candidates = {
+            other.id: other
+            for other in (by_key.get(person.block, [])[:DEDUP_MAX_BLOCK] if person.block else [])
+            + by_key.get("@" + person.email_key, [])
+            if other.id != person.id
+        }
+        found = []
+        for other in candidates.values():
+            value, _ = score(person, other)
+            if value >= threshold:
+                found.append(_member(other, value))
+        found.sort(key=lambda m: (-m["score"], m["id"]))
+        matches.append(found)
+    return matches
+
+
+# ---------- clés stockées en base ----------
+
+def _set_keys(mapper, connection, target) -> None:
+    for column, value in dedup_keys(target.first_name, target.last_name, target.email).items():
+        setattr(target, column, value)
+
+
+for _model in (models.Student, models.Participant):
+    event.listen(_model, "before_insert", _set_keys)
+    event.listen(_model, "before_update", _set_keys)
+
+
+def fill_missing_keys(engine, chunk_size: int = 5000) -> int:
+    """Calcule les clés des fiches créées avant leur ajout (au démarrage)."""
+    filled = 0
+    for model in (models.Student, models.Participant):
+        table = model.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(dedup_email=bindparam("b_email"), dedup_block=bindparam("b_block"))
+        )
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    select(table.c.id, table.c.first_name, table.c.last_name, table.c.email)
+                    .where(table.c.dedup_block.is_(None))
+                    .limit(chunk_size)
+                ).all()
+                if not rows:
+                    break
+                params = []
+                for id, first_name, last_name, email in rows:
+                    keys = dedup_keys(first_name, last_name, email)
+                    params.append(
+                        {"b_id": id, "b_email": keys["dedup_email"], "b_block": keys["dedup_block"]}
+                    )
+                conn.execute(stmt, params)
+                filled += len(rows)
+    return filled
@@ -1,22 +1,40 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 from jose import jwt, JWTError
 
+from app.cache_bus import LocalCache
 from app.db import get_db
 from app import models, schemas
 from app.security import ALGORITHM, SECRET_KEY
+from app.tracing import span
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
+# utilisateurs déjà authentifiés, par id (une lecture en base en moins par requête)
+_user_cache = LocalCache("users", max_entries=4096)
+_USER_CACHE_COLUMNS = ("id", "email", "name", "hashed_password", "is_superadmin")
+
+
 def get_user_by_id(user_id: int, db: Session) -> models.User | None:
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    snapshot = _user_cache.get(user_id)
+    if snapshot is None:
+        version = _user_cache.version()
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if user is not None:
+            _user_cache.set(user_id, {c: getattr(user, c) for c in _USER_CACHE_COLUMNS}, version)
+        return user
+
+    # objet rattaché à la session sans la requérir (comme s'il venait d'être chargé)
+    user = models.User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
 
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ) -> models.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -25,7 +43,8 @@ async def get_current_user(
     )
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with span("jwt.decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         raw_user_id = payload.get("sub")
         if raw_user_id is None:
             raise credentials_exception
@@ -36,7 +55,8 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = get_user_by_id(user_id=user_id, db=db)
+    with span("get_current_user"):
+        user = get_user_by_id(user_id=user_id, db=db)
     if user is None:
         raise credentials_exception
 
@@ -0,0 +1,285 @@
+"""
+Support de l'en-tête `Idempotency-Key` sur les routes qui modifient des données.
+
+Un téléphone sur un réseau instable qui renvoie le même POST /scan (ou la même
+création de participant) avec la même clé reçoit la réponse d'origine, rejouée
+telle quelle, sans que la route soit ré-exécutée.
+
+    - la clé est propre à (méthode, chemin, en-tête Authorization) ;
+    - réutiliser une clé avec un autre body renvoie 422 ;
+    - une requête identique encore en cours de traitement renvoie 409 ;
+    - les réponses 5xx ne sont pas mémorisées (le client peut réessayer).
+
+Stockage : en mémoire (LRU + TTL) par défaut. Avec IDEMPOTENCY_BACKEND=sqlite,
+la mémoire sert de cache devant la table `idempotency_keys`, partagée par tous
+les workers.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db import SessionLocal
+from app import models
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")   # "memory" ou "sqlite"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# au-delà, la réponse n'est pas mémorisée (exports, ZIP...)
+IDEMPOTENCY_MAX_BODY = 1024 * 1024
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# (status, en-têtes, body)
+StoredResponse = Tuple[int, list, bytes]
+
+
+class MemoryStore:
+    """Réponses terminées (LRU borné + TTL) et requêtes en cours, pour ce process."""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_MAX_ENTRIES, ttl: int = IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._done: "OrderedDict[str, Tuple[float, str, StoredResponse]]" = OrderedDict()
+        self._in_flight: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, key: str) -> Optional[Tuple[str, Optional[StoredResponse]]]:
+        """(fingerprint, réponse) si la clé est connue ; réponse None = en cours."""
+        with self._lock:
+            entry = self._done.get(key)
+            if entry is not None:
+                expires, fingerprint, response = entry
+                if expires > time.monotonic():
+                    self._done.move_to_end(key)
+                    return fingerprint, response
+                del self._done[key]
+            if key in self._in_flight:
+                return self._in_flight[key], None
+        return None
+
+    def begin(self, key: str, fingerprint: str) -> bool:
+        with self._lock:
+            if key in self._in_flight or key in self._done:
+                return False
+            self._in_flight[key] = fingerprint
+            return True
+
+    def complete(self, key: str, fingerprint: str, response: StoredResponse) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._done[key] = (time.monotonic() + self.ttl, fingerprint, response)
+            self._done.move_to_end(key)
+            while len(self._done) > self.max_entries:
+                self._done.popitem(last=False)
+
+    def abort(self, key: str) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+
+class SQLiteStore:
+    """Table `idempotency_keys` : visible par tous les workers. Appels bloquants (threadpool)."""
+
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL_SECONDS):
+        self.ttl = ttl
+        self._calls = 0
+
+    def lookup(self, key: str) -> Optional[Tuple[str, Optional[StoredResponse]]]:
+        with SessionLocal() as db:
+            row = db.get(models.IdempotencyKey, key)
+            if row is None or row.expires_at <= datetime.utcnow():
+                return None
+            if row.status_code is None:
+                return row.fingerprint, None
+            return row.fingerprint, (row.status_code, json.loads(row.headers), row.body)
+
+    def begin(self, key: str, fingerprint: str) -> bool:
+        now = datetime.utcnow()
+        with SessionLocal() as db:
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at <= now))
+            db.execute(
+                delete(models.IdempotencyKey).where(
+                    models.IdempotencyKey.key == key,
+                    models.IdempotencyKey.expires_at <= now,
+                )
+            )
+            db.add(
+                models.IdempotencyKey(
+                    key=key,
+                    fingerprint=fingerprint,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl),
+                )
+            )
+            try:
+                db.commit()
+            except IntegrityError:
+                # un autre worker a déjà pris la clé
+                db.rollback()
+                return False
+        return True
+
+    def complete(self, key: str, fingerprint: str, response: StoredResponse) -> None:
+        status_code, headers, body = response
+        with SessionLocal() as db:
+            row = db.get(models.IdempotencyKey, key)
+            if row is not None:
+                row.status_code = status_code
+                row.headers = json.dumps(headers)
+                row.body = body
+                db.commit()
+
+    def abort(self, key: str) -> None:
+        with SessionLocal() as db:
+            db.execute(
+                delete(models.IdempotencyKey).where(
+                    models.IdempotencyKey.key == key,
+                    models.IdempotencyKey.status_code.is_(None),
+                )
+            )
+            db.commit()
+
+
+def _json_response(status_code: int, detail: str) -> StoredResponse:
+    body = json.dumps({"detail": detail}).encode()
+    return status_code, [["content-type", "application/json"]], body
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp, backend: str = IDEMPOTENCY_BACKEND):
+        self.app = app
+        self.memory = MemoryStore()
+        self.shared = SQLiteStore() if backend == "sqlite" else None
+
+    async def _lookup(self, key: str):
+        found = self.memory.lookup(key)
+        if found is None and self.shared is not None:
+            found = await run_in_threadpool(self.shared.lookup, key)
+            if found is not None and found[1] is not None:
+                # réponse terminée par un autre worker : on la garde aussi en mémoire
+                self.memory.complete(key, *found)
+        return found
+
+    async def _begin(self, key: str, fingerprint: str) -> bool:
+        if not self.memory.begin(key, fingerprint):
+            return False
+        if self.shared is not None and not await run_in_threadpool(self.shared.begin, key, fingerprint):
+            self.memory.abort(key)
+            return False
+        return True
+
+    async def _complete(self, key: str, fingerprint: str, response: StoredResponse) -> None:
+        self.memory.complete(key, fingerprint, response)
+        if self.shared is not None:
+            await run_in_threadpool(self.shared.complete, key, fingerprint, response)
+
+    async def _abort(self, key: str) -> None:
+        self.memory.abort(key)
+        if self.shared is not None:
+            await run_in_threadpool(self.shared.abort, key)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        raw_key = headers.get(IDEMPOTENCY_HEADER)
+        if not raw_key:
+            await self.app(scope, receive, send)
+            return
+
+        key = hashlib.sha256(
+            b"\0".join([scope["method"].encode(), scope["path"].encode(), headers.get(b"authorization", b""), raw_key])
+        ).hexdigest()
+
+        # on lit le body pour en calculer l'empreinte, puis on le rejoue pour la route
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        found = await self._lookup(key)
+        if found is None and not await self._begin(key, fingerprint):
+            found = await self._lookup(key)
+            if found is None:
+                # la clé vient d'être libérée (réponse 5xx) : on considère la requête en cours
+                found = (fingerprint, None)
+
+        if found is not None:
+            stored_fingerprint, response = found
+            if stored_fingerprint != fingerprint:
+                response = _json_response(422, "Idempotency-Key déjà utilisée avec un autre contenu")
+            elif response is None:
+                response = _json_response(409, "Requête identique en cours de traitement")
+            else:
+                status_code, stored_headers, stored_body = response
+                response = (status_code, stored_headers + [["idempotent-replayed", "true"]], stored_body)
+            await self._send_stored(send, response)
+            return
+
+        body_sent = False
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status_code = 500
+        response_headers: list = []
+        response_body = bytearray()
+        storable = True
+
+        async def capture_send(message: Message) -> None:
+            nonlocal status_code, response_headers, storable
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = [[k.decode("latin-1"), v.decode("latin-1")] for k, v in message.get("headers", [])]
+            elif message["type"] == "http.response.body" and storable:
+                response_body.extend(message.get("body", b""))
+                if len(response_body) > IDEMPOTENCY_MAX_BODY:
+                    storable = False
+                    response_body.clear()
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await self._abort(key)
+            raise
+
+        if storable and status_code < 500:
+            await self._complete(key, fingerprint, (status_code, response_headers, bytes(response_body)))
+        else:
+            await self._abort(key)
+
+    async def _send_stored(self, send: Send, response: StoredResponse) -> None:
+        status_code, headers, body = response
+        raw_headers = [
+            (k.encode("latin-1"), v.encode("latin-1"))
+            for k, v in headers
+            if k.lower() != "content-length"
+        ]
+        raw_headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status_code, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": body})
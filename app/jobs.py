@@ -0,0 +1,365 @@
+"""
+Exécution en arrière-plan des opérations longues (imports CSV, tickets en masse...).
+
+Les jobs sont stockés dans la table `jobs` de la base SQLite : c'est elle qui sert
+de file d'attente. Un petit pool de threads (JOB_WORKERS, 2 par défaut) réclame les
+jobs PENDING par priorité décroissante. Chaque handler enregistre régulièrement sa
+progression et un checkpoint, ce qui permet de reprendre un job interrompu par un
+redémarrage du serveur.
+
+Bail : tant qu'un job tourne, son process rafraîchit `updated_at` toutes les
+JOB_HEARTBEAT_SECONDS ; un job RUNNING sans nouvelles depuis JOB_STALE_SECONDS
+(process arrêté, même redémarré aussitôt) est remis en file par n'importe quel
+process. `started_at` identifie la réclamation : un handler dont le job a été
+repris ailleurs ne peut plus rien enregistrer (JobLost).
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, after_commit
+from app import models
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# délai max entre deux vérifications de la table quand aucun job n'est signalé
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# un job RUNNING sans nouvelles depuis ce délai est considéré comme interrompu
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "60"))
+# rafraîchissement du bail des jobs en cours (et recherche des jobs interrompus)
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+
+
+class JobCanceled(Exception):
+    """Levée dans le handler quand une annulation a été demandée."""
+
+
+class JobLost(Exception):
+    """Levée dans le handler quand le job a été remis en file (bail expiré) entre-temps."""
+
+
+class _Handler:
+    def __init__(self, func: Callable[["JobContext"], Optional[dict]], payload_model: Optional[Type[BaseModel]]):
+        self.func = func
+        self.payload_model = payload_model
+
+
+JOB_HANDLERS: Dict[str, _Handler] = {}
+
+
+def job_handler(kind: str, payload_model: Optional[Type[BaseModel]] = None):
+    """
+    Enregistre une fonction comme handler du type de job `kind`.
+    Le handler reçoit un JobContext et renvoie un dict (résultat) ou None.
+    """
+    def decorator(func):
+        JOB_HANDLERS[kind] = _Handler(func, payload_model)
+        return func
+
+    return decorator
+
+
+def validate_payload(kind: str, payload: dict) -> dict:
+    """Vérifie que le type de job existe et valide son payload. Lève ValueError sinon."""
+    handler = JOB_HANDLERS.get(kind)
+    if handler is None:
+        raise ValueError(f"Type de job inconnu : {kind}")
+    if handler.payload_model is not None:
+        payload = handler.payload_model(**payload).dict()
+    return payload
+
+
+class JobContext:
+    def __init__(self, job_id: int, payload: dict, checkpoint: Optional[dict], started_at: datetime):
+        self.job_id = job_id
+        self.payload = payload
+        self.checkpoint = checkpoint or {}
+        self.started_at = started_at
+
+    def progress(
+        self,
+        processed: int,
+        total: Optional[int] = None,
+        checkpoint: Optional[dict] = None,
+        db: Optional[Session] = None,
+    ) -> None:
+        """
+        Enregistre la progression (et éventuellement un checkpoint).
+
+        `db` : session de la transaction qui écrit le travail correspondant, commitée
+        ensuite par le handler : travail et checkpoint sont commités ensemble (un crash
+        entre les deux ne fait pas refaire le paquet). Sans `db` : transaction à part,
+        à appeler après avoir commité le travail.
+
+        Lève JobCanceled si une annulation a été demandée entre-temps, JobLost si le
+        job a été repris par un autre worker ; avec `db`, le paquet en cours n'est
+        alors pas commité.
+        """
+        values: Dict[str, Any] = {
+            "processed": processed,
+            "updated_at": datetime.utcnow(),
+        }
+        if total is not None:
+            values["total"] = total
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+            values["checkpoint"] = json.dumps(checkpoint)
+
+        stmt = (
+            update(models.Job)
+            .where(
+                models.Job.id == self.job_id,
+                models.Job.status == "RUNNING",
+                models.Job.started_at == self.started_at,
+            )
+            .values(**values)
+            .returning(models.Job.cancel_requested)
+        )
+        if db is not None:
+            row = db.execute(stmt).first()
+        else:
+            with SessionLocal() as own:
+                row = own.execute(stmt).first()
+                own.commit()
+        if row is None:
+            raise JobLost()
+        if row.cancel_requested:
+            raise JobCanceled()
+
+
+class JobRunner:
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self.max_workers = max_workers
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._threads: list[threading.Thread] = []
+        # jobs en cours dans ce process : id -> started_at (bail à rafraîchir)
+        self._running: Dict[int, datetime] = {}
+        self._running_lock = threading.Lock()
+        # réveil du heartbeat à l'arrêt (pas _wakeup : notify() réveille un seul thread)
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stopping = False
+        self._stopped.clear()
+        self._requeue_stale_jobs()
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(
+        self,
+        db: Session,
+        kind: str,
+        payload: dict,
+        priority: int = 0,
+        created_by_id: Optional[int] = None,
+    ) -> models.Job:
+        payload = validate_payload(kind, payload)
+        now = datetime.utcnow()
+        job = models.Job(
+            kind=kind,
+            status="PENDING",
+            priority=priority,
+            payload=json.dumps(payload),
+            processed=0,
+            cancel_requested=False,
+            created_by_id=created_by_id,
+            created_at=now,
+            updated_at=now,
+        )
+        db.add(job)
+        # commit par get_db en fin de requête : les workers ne réveillent qu'après
+        db.flush()
+        after_commit(db, self.notify)
+        return job
+
+    def cancel(self, db: Session, job: models.Job) -> models.Job:
+        # UPDATE conditionnels, comme la réclamation : un job réclamé entre la lecture
+        # et l'annulation n'est pas marqué CANCELED pendant qu'il tourne
+        now = datetime.utcnow()
+        db.execute(
+            update(models.Job)
+            .where(models.Job.id == job.id, models.Job.status == "PENDING")
+            .values(status="CANCELED", finished_at=now, updated_at=now)
+        )
+        # le handler s'arrêtera au prochain appel à ctx.progress()
+        db.execute(
+            update(models.Job)
+            .where(models.Job.id == job.id, models.Job.status == "RUNNING")
+            .values(cancel_requested=True)
+        )
+        db.flush()
+        db.refresh(job)
+        return job
+
+    def notify(self) -> None:
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _requeue_stale_jobs(self) -> None:
+        # jobs RUNNING interrompus (crash / redémarrage) : bail expiré, on les remet
+        # en file, ils reprendront depuis leur dernier checkpoint (sauf annulation demandée)
+        now = datetime.utcnow()
+        stale = (
+            models.Job.status == "RUNNING",
+            models.Job.updated_at < now - timedelta(seconds=JOB_STALE_SECONDS),
+        )
+        with SessionLocal() as db:
+            db.execute(
+                update(models.Job)
+                .where(*stale, models.Job.cancel_requested.is_(True))
+                .values(status="CANCELED", finished_at=now, updated_at=now)
+            )
+            requeued = db.execute(
+                update(models.Job).where(*stale).values(status="PENDING", updated_at=now)
+            ).rowcount
+            db.commit()
+        if requeued:
+            logger.warning("%s job(s) interrompu(s) remis en file", requeued)
+            self.notify()
+
+    def _heartbeat(self) -> None:
+        while not self._stopped.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                with self._running_lock:
+                    leases = [
+                        {"b_id": job_id, "b_started_at": started_at}
+                        for job_id, started_at in self._running.items()
+                    ]
+                if leases:
+                    with SessionLocal() as db:
+                        db.execute(
+                            update(models.Job.__table__)
+                            .where(
+                                models.Job.__table__.c.id == bindparam("b_id"),
+                                models.Job.__table__.c.status == "RUNNING",
+                                models.Job.__table__.c.started_at == bindparam("b_started_at"),
+                            )
+                            .values(updated_at=datetime.utcnow()),
+                            leases,
+                        )
+                        db.commit()
+                self._requeue_stale_jobs()
+            except Exception:
+                logger.exception("Impossible de rafraîchir le bail des jobs")
+
+    def _claim_next(self) -> Optional[Tuple[int, datetime]]:
+        with SessionLocal() as db:
+            candidates = (
+                db.query(models.Job.id)
+                .filter(models.Job.status == "PENDING")
+                .order_by(models.Job.priority.desc(), models.Job.id)
+                .limit(self.max_workers)
+                .all()
+            )
+            for (job_id,) in candidates:
+                # UPDATE conditionnel : un seul worker (ou process) gagne le job
+                now = datetime.utcnow()
+                claimed = db.execute(
+                    update(models.Job)
+                    .where(models.Job.id == job_id, models.Job.status == "PENDING")
+                    .values(status="RUNNING", started_at=now, updated_at=now)
+                ).rowcount
+                db.commit()
+                if claimed:
+                    return job_id, now
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+            try:
+                claimed = self._claim_next()
+            except Exception:
+                logger.exception("Impossible de réclamer un job")
+                claimed = None
+
+            if claimed is None:
+                with self._wakeup:
+                    if self._stopping:
+                        return
+                    self._wakeup.wait(JOB_POLL_SECONDS)
+                continue
+
+            job_id, started_at = claimed
+            with self._running_lock:
+                self._running[job_id] = started_at
+            try:
+                self._run(job_id, started_at)
+            finally:
+                with self._running_lock:
+                    self._running.pop(job_id, None)
+
+    def _finish(self, job_id: int, started_at: datetime, **values) -> None:
+        values["finished_at"] = datetime.utcnow()
+        values["updated_at"] = values["finished_at"]
+        with SessionLocal() as db:
+            db.execute(
+                update(models.Job)
+                .where(
+                    models.Job.id == job_id,
+                    models.Job.status == "RUNNING",
+                    models.Job.started_at == started_at,
+                )
+                .values(**values)
+            )
+            db.commit()
+
+    def _run(self, job_id: int, started_at: datetime) -> None:
+        with SessionLocal() as db:
+            job = db.query(models.Job).filter(models.Job.id == job_id).first()
+            kind = job.kind
+            payload = json.loads(job.payload or "{}")
+            checkpoint = json.loads(job.checkpoint) if job.checkpoint else None
+
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            self._finish(job_id, started_at, status="FAILED", error=f"Type de job inconnu : {kind}")
+            return
+
+        ctx = JobContext(job_id, payload, checkpoint, started_at)
+        try:
+            result = handler.func(ctx)
+        except JobCanceled:
+            self._finish(job_id, started_at, status="CANCELED")
+        except JobLost:
+            logger.warning("Job %s (%s) repris par un autre worker, abandonné ici", job_id, kind)
+        except Exception as exc:
+            logger.exception("Job %s (%s) en échec", job_id, kind)
+            self._finish(job_id, started_at, status="FAILED", error=str(exc))
+        else:
+            self._finish(
+                job_id,
+                started_at,
+                status="DONE",
+                result=json.dumps(result) if result is not None else None,
+            )
+
+
+job_runner = JobRunner()
@@ -0,0 +1,360 @@
+"""
+Envoi des tickets par mail, en arrière-plan.
+
+Les messages sont rendus à la mise en file (route /events/{id}/mail/send) et stockés
+dans la table `email_deliveries`, qui sert de file d'attente durable. Des threads
+d'envoi réclament des paquets de messages, les envoient sur des connexions SMTP
+réutilisées, en respectant un débit maximum par minute, et enregistrent le statut
+de chaque participant. Les échecs temporaires sont retentés avec un délai croissant.
+
+Un message réclamé (SENDING) porte l'heure de sa réclamation (`claimed_at`),
+renouvelée juste avant son envoi : il n'est repris par un autre thread ou process
+qu'après MAIL_LEASE_SECONDS (envoyeur arrêté brutalement), jamais pendant qu'un
+autre worker est en train de l'envoyer.
+
+Le débit est partagé par tous les process : un message n'est réclamé que si moins
+de MAIL_RATE_PER_MINUTE messages ont été réclamés ou envoyés dans la dernière
+minute (compté en base sur `claimed_at`). Le seau à jetons de chaque process ne
+fait que lisser les envois d'un paquet.
+
+En dev, on peut utiliser un faux serveur SMTP local :
+    python -m aiosmtpd -n -l localhost:1025
+"""
+import logging
+import os
+import queue
+import smtplib
+import string
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import List, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import aliased
+
+from app.db import SessionLocal
+from app import models
+from app.qrcodes import get_qr_image
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "0") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+MAIL_FROM = os.getenv("MAIL_FROM", "billetterie@tdlog.local")
+
+MAIL_SENDERS = int(os.getenv("MAIL_SENDERS", "2"))             # threads = connexions SMTP max
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "20"))
+MAIL_RATE_PER_MINUTE = int(os.getenv("MAIL_RATE_PER_MINUTE", "120"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+MAIL_BACKOFF_SECONDS = float(os.getenv("MAIL_BACKOFF_SECONDS", "30"))
+MAIL_POLL_SECONDS = float(os.getenv("MAIL_POLL_SECONDS", "5"))
+# au-delà, un message SENDING est considéré comme abandonné (doit dépasser l'envoi d'un message)
+MAIL_LEASE_SECONDS = float(os.getenv("MAIL_LEASE_SECONDS", "600"))
+
+DEFAULT_SUBJECT = "Ton billet pour $event_name"
+DEFAULT_TEMPLATE = (
+    "Bonjour $first_name,\n\n"
+    "Voici ton billet pour $event_name ($event_date, $event_location).\n"
+    "Présente le QR code joint à l'entrée.\n"
+)
+
+
+def render_message(
+    event: models.Event,
+    participant: models.Participant,
+) -> tuple[str, str]:
+    """Renvoie (sujet, corps) du mail d'un participant à partir du modèle de l'event."""
+    values = {
+        "first_name": participant.first_name,
+        "last_name": participant.last_name,
+        "promo": participant.promo or "",
+        "tarif": participant.tarif or "",
+        "email": participant.email or "",
+        "qr_code": participant.qr_code,
+        "event_name": event.name or "",
+        "event_date": event.date.strftime("%d/%m/%Y %H:%M") if event.date else "",
+        "event_location": event.location or "",
+    }
+    subject = string.Template(event.email_subject or DEFAULT_SUBJECT).safe_substitute(values)
+    body = string.Template(event.email_template or DEFAULT_TEMPLATE).safe_substitute(values)
+    return subject, body
+
+
+class RateLimiter:
+    """
+    Seau à jetons : au plus `per_minute` envois par minute, partagé entre les threads
+    d'un process. Le plafond entre process est appliqué en base par Mailer._claim_batch.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(1, per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SMTPPool:
+    """Connexions SMTP réutilisées d'un paquet à l'autre (évite un handshake par mail)."""
+
+    def __init__(self, max_size: int):
+        self._idle: "queue.LifoQueue[smtplib.SMTP]" = queue.LifoQueue(maxsize=max_size)
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
+            conn.starttls()
+        if SMTP_USER:
+            conn.login(SMTP_USER, SMTP_PASSWORD or "")
+        return conn
+
+    def acquire(self) -> smtplib.SMTP:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            try:
+                if conn.noop()[0] == 250:
+                    return conn
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self.discard(conn)
+
+    def release(self, conn: smtplib.SMTP) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self.discard(conn)
+
+    def discard(self, conn: smtplib.SMTP) -> None:
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self.discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class Mailer:
+    def __init__(self, senders: int = MAIL_SENDERS):
+        self.senders = senders
+        self.pool = SMTPPool(max_size=senders)
+        self.rate_limiter = RateLimiter(MAIL_RATE_PER_MINUTE)
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stopping = False
+        # messages SENDING d'un arrêt brutal : repris par _claim_batch une fois leur bail expiré
+        for i in range(self.senders):
+            thread = threading.Thread(target=self._worker, name=f"mail-sender-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.pool.close_all()
+
+    def notify(self) -> None:
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _batch_limit(self) -> int:
+        """Taille d'un paquet : tout le paquet doit pouvoir partir au débit max avant la
+        moitié du bail, sinon ses derniers messages seraient repris par un autre envoyeur."""
+        within_lease = int(MAIL_RATE_PER_MINUTE * MAIL_LEASE_SECONDS / 60 / 2)
+        return max(1, min(MAIL_BATCH_SIZE, within_lease))
+
+    def _claim_batch(self) -> List[models.EmailDelivery]:
+        now = datetime.utcnow()
+        delivery = models.EmailDelivery
+        claimable = or_(
+            and_(
+                delivery.status == "PENDING",
+                delivery.next_attempt_at.is_(None) | (delivery.next_attempt_at <= now),
+            ),
+            # bail expiré : envoyeur arrêté en cours de paquet (NULL : réclamé avant claimed_at)
+            and_(
+                delivery.status == "SENDING",
+                delivery.claimed_at.is_(None)
+                | (delivery.claimed_at < now - timedelta(seconds=MAIL_LEASE_SECONDS)),
+            ),
+        )
+        # débit global, tous process confondus : réclamations de la dernière minute
+        recent = aliased(models.EmailDelivery)
+        claimed_last_minute = (
+            select(func.count())
+            .select_from(recent)
+            .where(recent.claimed_at > now - timedelta(seconds=60))
+            .scalar_subquery()
+        )
+        with SessionLocal() as db:
+            candidates = (
+                db.query(delivery.id)
+                .filter(claimable)
+                .order_by(delivery.id)
+                .limit(self._batch_limit())
+                .all()
+            )
+            claimed = []
+            for (delivery_id,) in candidates:
+                # UPDATE conditionnel : un message n'est réclamé que par un seul thread / process,
+                # et seulement s'il reste du débit (le verrou d'écriture SQLite sérialise le compte)
+                rowcount = db.execute(
+                    update(delivery)
+                    .where(
+                        delivery.id == delivery_id,
+                        claimable,
+                        claimed_last_minute < MAIL_RATE_PER_MINUTE,
+                    )
+                    .values(status="SENDING", claimed_at=now)
+                ).rowcount
+                if rowcount:
+                    claimed.append(delivery_id)
+            db.commit()
+
+            if not claimed:
+                return []
+            deliveries = (
+                db.query(models.EmailDelivery)
+                .filter(models.EmailDelivery.id.in_(claimed))
+                .all()
+            )
+            db.expunge_all()
+            return deliveries
+
+    def _renew_lease(self, delivery: models.EmailDelivery) -> bool:
+        """Repousse le bail juste avant l'envoi ; False si un autre envoyeur a repris le message."""
+        now = datetime.utcnow()
+        with SessionLocal() as db:
+            rowcount = db.execute(
+                update(models.EmailDelivery)
+                .where(
+                    models.EmailDelivery.id == delivery.id,
+                    models.EmailDelivery.status == "SENDING",
+                    models.EmailDelivery.claimed_at == delivery.claimed_at,
+                )
+                .values(claimed_at=now)
+            ).rowcount
+            db.commit()
+        if rowcount:
+            delivery.claimed_at = now
+        return bool(rowcount)
+
+    def _build_message(self, delivery: models.EmailDelivery) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = MAIL_FROM
+        message["To"] = delivery.email
+        message["Subject"] = delivery.subject
+        message.set_content(delivery.body)
+        if delivery.qr_code:
+            image, _ = get_qr_image(delivery.qr_code, "png", 8)
+            message.add_attachment(image, maintype="image", subtype="png", filename="billet.png")
+        return message
+
+    def _send_batch(self, deliveries: List[models.EmailDelivery]) -> None:
+        results = []
+        conn: Optional[smtplib.SMTP] = None
+        for delivery in deliveries:
+            self.rate_limiter.acquire()
+            if not self._renew_lease(delivery):
+                logger.warning("Mail %s repris par un autre envoyeur", delivery.id)
+                continue
+            try:
+                if conn is None:
+                    conn = self.pool.acquire()
+                conn.send_message(self._build_message(delivery))
+            except smtplib.SMTPRecipientsRefused as exc:
+                # adresse refusée : inutile de réessayer
+                results.append((delivery, "FAILED", str(exc)))
+            except (smtplib.SMTPException, OSError) as exc:
+                if conn is not None:
+                    self.pool.discard(conn)
+                    conn = None
+                status = "FAILED" if delivery.attempts + 1 >= MAIL_MAX_ATTEMPTS else "PENDING"
+                results.append((delivery, status, str(exc)))
+            except Exception as exc:
+                logger.exception("Mail %s impossible à construire", delivery.id)
+                results.append((delivery, "FAILED", str(exc)))
+            else:
+                results.append((delivery, "SENT", None))
+
+        if conn is not None:
+            self.pool.release(conn)
+
+        now = datetime.utcnow()
+        with SessionLocal() as db:
+            for delivery, status, error in results:
+                attempts = delivery.attempts + 1
+                values = {"status": status, "attempts": attempts, "last_error": error}
+                if status == "SENT":
+                    values["sent_at"] = now
+                elif status == "PENDING":
+                    delay = MAIL_BACKOFF_SECONDS * (2 ** (attempts - 1))
+                    values["next_attempt_at"] = now + timedelta(seconds=delay)
+                # seulement si le bail n'a pas été repris entre-temps
+                db.execute(
+                    update(models.EmailDelivery)
+                    .where(
+                        models.EmailDelivery.id == delivery.id,
+                        models.EmailDelivery.status == "SENDING",
+                        models.EmailDelivery.claimed_at == delivery.claimed_at,
+                    )
+                    .values(**values)
+                )
+            db.commit()
+
+    def _worker(self) -> None:
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+            try:
+                batch = self._claim_batch()
+                if batch:
+                    self._send_batch(batch)
+                    continue
+            except Exception:
+                logger.exception("Erreur dans l'envoi des mails")
+
+            with self._wakeup:
+                if self._stopping:
+                    return
+                self._wakeup.wait(MAIL_POLL_SECONDS)
+
+
+mailer = Mailer()
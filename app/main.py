@@ -1,15 +1,48 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .routers import auth, events, tickets, scan, admin, students, participants
-from .db import Base, engine
+from .routers import auth, events, tickets, scan, admin, students, participants, exports, jobs, qrcodes, mail, archive, analytics, quotas
+from .db import Base, engine, ensure_schema
+from .dedup import fill_missing_keys
 from .initial_superadmin import ensure_initial_superadmin
+from .cache_bus import cache_bus
+from .compression import CompressionMiddleware
+from .idempotency import IdempotencyMiddleware
+from .jobs import job_runner
+from .ratelimit import RateLimitMiddleware
+from .mailer import mailer
+from .scan_audit import scan_audit
+from .scan_store import scan_store
+from .qrcodes import shutdown_pool as shutdown_qr_pool
+from .tracing import TRACE_SAMPLE_RATE, TracingMiddleware, exporter as trace_exporter, instrument_engine, instrument_fastapi
 
 # Création des tables au démarrage (simple pour dev)
 Base.metadata.create_all(bind=engine)
+ensure_schema()
+fill_missing_keys(engine)
 ensure_initial_superadmin()
 
-app = FastAPI(title="TD-LOG API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # threads de fond démarrés avec le serveur, arrêtés proprement à la fin
+    scan_store.start()
+    scan_audit.start()
+    job_runner.start()
+    mailer.start()
+    yield
+    mailer.stop()
+    scan_audit.stop()
+    scan_store.stop()
+    job_runner.stop()
+    shutdown_qr_pool()
+    cache_bus.close()
+    trace_exporter.close()
+
+
+app = FastAPI(title="TD-LOG API", version="0.1.0", lifespan=lifespan)
 
 #Quand on lance le backend
 @app.get("/")
@@ -22,6 +55,13 @@ def health():
     return {"status": "ok"}
 
 
+# ajoutés avant CORS : les réponses rejouées / refusées passent aussi par le middleware CORS
+app.add_middleware(IdempotencyMiddleware)
+# au-dessus de l'idempotence : les réponses sont mémorisées non compressées
+app.add_middleware(CompressionMiddleware)
+# le plus à l'extérieur possible : une requête en trop est refusée avant tout autre travail
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # en dev : on autorise tout, on durcira plus tard si besoin
@@ -30,6 +70,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if TRACE_SAMPLE_RATE > 0:
+    # ajouté en dernier : la trace couvre toute la requête, middlewares compris
+    instrument_engine(engine)
+    instrument_fastapi()
+    app.add_middleware(TracingMiddleware)
+
 app.include_router(auth.router)
 app.include_router(events.router)
 app.include_router(tickets.router)
@@ -37,3 +83,10 @@ app.include_router(scan.router)
 app.include_router(admin.router)
 app.include_router(students.router)
 app.include_router(participants.router)
+app.include_router(exports.router)
+app.include_router(jobs.router)
+app.include_router(qrcodes.router)
+app.include_router(mail.router)
+app.include_router(archive.router)
+app.include_router(analytics.router)
+app.include_router(quotas.router)
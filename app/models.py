@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, Index, LargeBinary, func, text
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -19,6 +19,8 @@ class Event(Base):
     location = Column(String)
     created_by_id = Column(Integer, ForeignKey('users.id'))
     created_by = relationship('User')
+    email_subject = Column(String, nullable=True)
+    email_template = Column(Text, nullable=True)
 
 class EventAdmin(Base):
     __tablename__ = 'event_admins'
@@ -29,6 +31,10 @@ class EventAdmin(Base):
 
 class Ticket(Base):
     __tablename__ = 'tickets'
+    __table_args__ = (
+        # filtre ?status= sur la liste des participants / l'export
+        Index("ix_tickets_event_status", "event_id", "status"),
+    )
     id = Column(Integer, primary_key=True)
     event_id = Column(Integer, ForeignKey('events.id'))
     user_email = Column(String)
@@ -45,10 +51,26 @@ class Student(Base):
     last_name = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     is_external = Column(Boolean, default=False)
+    # clés de blocage de la détection de doublons (cf. dedup.py)
+    dedup_email = Column(String, nullable=True, index=True)
+    dedup_block = Column(String, nullable=True, index=True)
 
 
 class Participant(Base):
     __tablename__ = "participants"
+    __table_args__ = (
+        # tri des participants par email (cf. queries.participant_select)
+        Index("ix_participants_event_email", "event_id", "email"),
+        # "déjà inscrit ?" lors de l'inscription en masse d'étudiants (email sans casse)
+        Index("ix_participants_event_email_lower", "event_id", func.lower(text("email"))),
+        # liste des participants : tri par défaut et filtres (cf. queries.participant_select)
+        Index("ix_participants_event_name", "event_id", "last_name", "first_name"),
+        Index("ix_participants_event_tarif", "event_id", "tarif"),
+        Index("ix_participants_event_promo", "event_id", "promo"),
+        # doublons probables dans l'event (cf. dedup.py)
+        Index("ix_participants_event_dedup_email", "event_id", "dedup_email"),
+        Index("ix_participants_event_dedup_block", "event_id", "dedup_block"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     event_id = Column(Integer, ForeignKey("events.id"), nullable=False, index=True)
@@ -58,4 +80,112 @@ class Participant(Base):
     email = Column(String, nullable=True)
     tarif = Column(String, nullable=True)
     qr_code = Column(String, unique=True, index=True, nullable=False)
+    dedup_email = Column(String, nullable=True)
+    dedup_block = Column(String, nullable=True)
     event = relationship("Event", backref="participants")
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, default="PENDING", index=True)  # PENDING / RUNNING / DONE / FAILED / CANCELED
+    priority = Column(Integer, default=0)
+    payload = Column(Text, nullable=True)      # JSON
+    checkpoint = Column(Text, nullable=True)   # JSON, pour reprendre après un redémarrage
+    result = Column(Text, nullable=True)       # JSON
+    error = Column(String, nullable=True)
+    processed = Column(Integer, default=0)
+    total = Column(Integer, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+class EmailDelivery(Base):
+    __tablename__ = "email_deliveries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=False, index=True)
+    participant_id = Column(Integer, ForeignKey("participants.id"), nullable=False, unique=True)
+    email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    qr_code = Column(String, nullable=True)     # pour joindre l'image du QR code
+    status = Column(String, default="PENDING", index=True)  # PENDING / SENDING / SENT / FAILED
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)
+    # passage à SENDING, renouvelé avant chaque envoi (bail + débit global)
+    claimed_at = Column(DateTime, nullable=True, index=True)
+    created_at = Column(DateTime)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class ScanAttempt(Base):
+    """Journal de chaque appel à /scan (acceptés et refusés)"""
+    __tablename__ = "scan_attempts"
+    __table_args__ = (
+        Index("ix_scan_attempts_event_created", "event_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False, index=True)
+    event_id = Column(Integer, nullable=True)
+    token = Column(String, nullable=True)
+    valid = Column(Boolean, nullable=False)
+    reason = Column(String, nullable=True)
+    device_id = Column(String, nullable=True)
+    gate = Column(String, nullable=True)
+    latency_ms = Column(Float, nullable=True)
+
+
+class ScanRollup(Base):
+    """Scans acceptés par minute, porte et tarif (tenu à jour à chaque scan, cf. rollups.py)"""
+    __tablename__ = "scan_rollups"
+    __table_args__ = (
+        # une ligne par tranche ; sert aussi aux requêtes par event et par période
+        Index("ux_scan_rollups_bucket", "event_id", "minute", "gate", "tarif", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, nullable=False)
+    minute = Column(DateTime, nullable=False)             # début de la minute (UTC)
+    gate = Column(String, nullable=False, default="")     # "" = porte inconnue
+    tarif = Column(String, nullable=False, default="")    # "" = sans tarif
+    scans = Column(Integer, nullable=False, default=0)
+
+
+class IdempotencyKey(Base):
+    """Réponses mémorisées pour l'en-tête Idempotency-Key (partagées entre workers)"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)          # hash (méthode, chemin, utilisateur, clé)
+    fingerprint = Column(String, nullable=False)    # hash du body de la requête
+    status_code = Column(Integer, nullable=True)    # NULL tant que la requête est en cours
+    headers = Column(Text, nullable=True)           # JSON
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class CacheVersion(Base):
+    """Compteur d'invalidation par cache, lu par tous les workers (cf. cache_bus.py)"""
+    __tablename__ = "cache_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class EventQuota(Base):
+    """Compteur de places : capacité de l'event (tarif "") ou quota d'un tarif (cf. quotas.py)"""
+    __tablename__ = "event_quotas"
+
+    event_id = Column(Integer, primary_key=True)
+    tarif = Column(String, primary_key=True)        # "" = capacité totale (tickets de l'event)
+    capacity = Column(Integer, nullable=False)
+    used = Column(Integer, nullable=False, default=0)
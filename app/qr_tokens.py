@@ -0,0 +1,135 @@
+"""
+Tokens de QR code signés (HMAC), vérifiables sans accès à la base.
+
+Format : T1.<kid>.<event_id en base 36>.<nonce>.<mac>
+    - kid   : identifiant de la clé de signature (rotation des clés)
+    - nonce : 9 octets aléatoires en base64url, identifie le ticket
+    - mac   : HMAC-SHA256 tronqué à 12 octets (base64url) de "T1.<kid>.<event>.<nonce>",
+              calculé avec la clé de l'event = HMAC-SHA256(clé maître, "event:<id>")
+
+La clé dérivée par event permet de donner à un scanner de quoi vérifier les
+tokens de son event (hors ligne) sans pouvoir en fabriquer pour les autres.
+
+Les anciens tokens aléatoires (secrets.token_urlsafe(16)) restent acceptés tant
+que QR_ACCEPT_LEGACY_TOKENS vaut 1 : ils ne sont alors vérifiés qu'en base.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+from typing import Dict, Optional
+
+from app.security import SECRET_KEY
+
+TOKEN_VERSION = "T1"
+NONCE_BYTES = 9
+MAC_BYTES = 12
+
+_LEGACY_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{22}$")
+_KID_RE = re.compile(r"^[A-Za-z0-9]{1,8}$")
+
+
+def _load_keys() -> Dict[str, bytes]:
+    """
+    QR_SIGNING_KEYS="k2:nouveau_secret,k1:ancien_secret" : toutes les clés acceptées
+    à la vérification. La clé courante (signature) est QR_SIGNING_KEY_ID, ou la première.
+    """
+    raw = os.getenv("QR_SIGNING_KEYS")
+    if not raw:
+        return {"k0": hashlib.sha256(f"qr:{SECRET_KEY}".encode()).digest()}
+
+    keys: Dict[str, bytes] = {}
+    for item in raw.split(","):
+        kid, _, secret = item.strip().partition(":")
+        if not _KID_RE.match(kid) or not secret:
+            raise ValueError(f"QR_SIGNING_KEYS invalide : {item!r}")
+        keys[kid] = secret.encode()
+    return keys
+
+
+SIGNING_KEYS = _load_keys()
+CURRENT_KEY_ID = os.getenv("QR_SIGNING_KEY_ID") or next(iter(SIGNING_KEYS))
+ACCEPT_LEGACY_TOKENS = os.getenv("QR_ACCEPT_LEGACY_TOKENS", "1") == "1"
+
+if CURRENT_KEY_ID not in SIGNING_KEYS:
+    raise ValueError(f"QR_SIGNING_KEY_ID inconnu : {CURRENT_KEY_ID}")
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _to_base36(value: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        value, rest = divmod(value, 36)
+        out = digits[rest] + out
+        if value == 0:
+            return out
+
+
+def event_key(kid: str, event_id: int) -> bytes:
+    return hmac.new(SIGNING_KEYS[kid], f"event:{event_id}".encode(), hashlib.sha256).digest()
+
+
+def _mac(key: bytes, message: str) -> str:
+    return _b64(hmac.new(key, message.encode(), hashlib.sha256).digest()[:MAC_BYTES])
+
+
+def generate_token(event_id: int) -> str:
+    message = ".".join(
+        [TOKEN_VERSION, CURRENT_KEY_ID, _to_base36(event_id), _b64(secrets.token_bytes(NONCE_BYTES))]
+    )
+    return f"{message}.{_mac(event_key(CURRENT_KEY_ID, event_id), message)}"
+
+
+def is_legacy_token(token: str) -> bool:
+    return bool(_LEGACY_TOKEN_RE.match(token))
+
+
+def token_event_id(token: str) -> Optional[int]:
+    """Event encodé dans un token signé (None pour un ancien token ou un token illisible)."""
+    parts = token.split(".")
+    if len(parts) != 5 or parts[0] != TOKEN_VERSION:
+        return None
+    try:
+        return int(parts[2], 36)
+    except ValueError:
+        return None
+
+
+def check_token(token: str, expected_event_id: Optional[int] = None) -> Optional[str]:
+    """
+    Pré-validation sans base de données.
+    Renvoie None si le token peut correspondre à un ticket, sinon la raison du refus
+    ("malformed_token", "unknown_key", "invalid_signature", "wrong_event").
+    """
+    if not token.startswith(TOKEN_VERSION + "."):
+        if ACCEPT_LEGACY_TOKENS and is_legacy_token(token):
+            return None
+        return "malformed_token"
+
+    parts = token.split(".")
+    event_id = token_event_id(token)
+    if event_id is None:
+        return "malformed_token"
+
+    _, kid, _, _, mac = parts
+    if kid not in SIGNING_KEYS:
+        return "unknown_key"
+
+    message = token.rsplit(".", 1)[0]
+    if not hmac.compare_digest(mac, _mac(event_key(kid, event_id), message)):
+        return "invalid_signature"
+
+    if expected_event_id is not None and event_id != expected_event_id:
+        return "wrong_event"
+    return None
+
+
+def verification_keys(event_id: int) -> Dict[str, str]:
+    """Clés (base64url) d'un event, à distribuer aux scanners pour la vérification hors ligne."""
+    return {kid: _b64(event_key(kid, event_id)) for kid in SIGNING_KEYS}
@@ -0,0 +1,224 @@
+"""
+Génération des QR codes côté serveur (PNG / SVG / PDF multi-pages).
+
+Ce module ne dépend pas de la base : il est importé par les process du pool de
+rendu (ProcessPoolExecutor) et doit rester léger.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import segno
+
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", "2048"))
+QR_RENDER_WORKERS = int(os.getenv("QR_RENDER_WORKERS", str(os.cpu_count() or 1)))
+# en dessous de ce nombre d'images, le pool de process coûte plus qu'il ne rapporte
+QR_PARALLEL_THRESHOLD = 64
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+def render_qr(token: str, fmt: str = "png", scale: int = 8) -> bytes:
+    qr = segno.make(token, error="m", micro=False)
+    buffer = io.BytesIO()
+    if fmt == "svg":
+        qr.save(buffer, kind="svg", scale=scale, border=4, xmldecl=False)
+    else:
+        qr.save(buffer, kind="png", scale=scale, border=4)
+    return buffer.getvalue()
+
+
+def _render_qr_args(args: Tuple[str, str, int]) -> bytes:
+    return render_qr(*args)
+
+
+class QRCache:
+    """Cache LRU (token, format, échelle) -> (image, etag), partagé entre les threads."""
+
+    def __init__(self, max_entries: int = QR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Tuple[bytes, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, image: bytes) -> Tuple[bytes, str]:
+        # l'image ne dépend que du token : son hash sert d'ETag
+        entry = (image, hashlib.sha256(image).hexdigest()[:32])
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+
+qr_cache = QRCache()
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" : on ne duplique pas les threads du serveur (fork + threads = risqué)
+            _pool = ProcessPoolExecutor(
+                max_workers=QR_RENDER_WORKERS,
+                mp_context=get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def get_qr_image(token: str, fmt: str = "png", scale: int = 8) -> Tuple[bytes, str]:
+    key = (token, fmt, scale)
+    entry = qr_cache.get(key)
+    if entry is None:
+        entry = qr_cache.put(key, render_qr(token, fmt, scale))
+    return entry
+
+
+def _parallel_map(func, items: Sequence) -> List:
+    if len(items) < QR_PARALLEL_THRESHOLD or QR_RENDER_WORKERS <= 1:
+        return [func(item) for item in items]
+    chunksize = max(1, len(items) // (QR_RENDER_WORKERS * 4))
+    return list(_get_pool().map(func, items, chunksize=chunksize))
+
+
+def render_many(tokens: Sequence[str], fmt: str = "png", scale: int = 8) -> List[bytes]:
+    """
+    Rend une liste de QR codes en parallèle. Les images déjà en cache ne sont pas
+    recalculées, les autres y sont ajoutées (GET /qr/{token} les sert ensuite).
+    """
+    images: List[Optional[bytes]] = []
+    missing: List[int] = []
+    for i, token in enumerate(tokens):
+        entry = qr_cache.get((token, fmt, scale))
+        images.append(entry[0] if entry else None)
+        if entry is None:
+            missing.append(i)
+
+    rendered = _parallel_map(_render_qr_args, [(tokens[i], fmt, scale) for i in missing])
+    for i, image in zip(missing, rendered):
+        images[i] = image
+        qr_cache.put((tokens[i], fmt, scale), image)
+    return images
+
+
+# ==========================
+# PDF (une page A4 par ticket)
+# ==========================
+
+PAGE_WIDTH = 595   # A4 en points
+PAGE_HEIGHT = 842
+QR_SIZE = 360
+
+
+def _pdf_escape(text: str) -> bytes:
+    raw = text.encode("cp1252", errors="replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _pdf_page_content(args: Tuple[str, str]) -> bytes:
+    """Flux de contenu PDF d'une page : le QR dessiné en rectangles + le nom du titulaire."""
+    token, caption = args
+    qr = segno.make(token, error="m", micro=False)
+    matrix = qr.matrix
+    border = 4
+    modules = len(matrix) + 2 * border
+    module_size = QR_SIZE / modules
+    x0 = (PAGE_WIDTH - QR_SIZE) / 2
+    y0 = (PAGE_HEIGHT - QR_SIZE) / 2 + 60
+
+    size = len(matrix)
+    # repère en unités de module : les rectangles s'écrivent avec des entiers
+    ops = [
+        b"q %.4f 0 0 %.4f %.2f %.2f cm 0 g" % (module_size, module_size, x0, y0)
+    ]
+    for row_index, row in enumerate(matrix):
+        y = size - 1 - row_index + border
+        col = 0
+        # on regroupe les modules noirs consécutifs en un seul rectangle
+        while col < size:
+            if row[col]:
+                start = col
+                while col < size and row[col]:
+                    col += 1
+                ops.append(b"%d %d %d 1 re" % (start + border, y, col - start))
+            else:
+                col += 1
+    ops.append(b"f Q")
+
+    if caption:
+        ops.append(
+            b"BT /F1 18 Tf %.1f %.1f Td (%s) Tj ET"
+            % (x0, y0 - 40, _pdf_escape(caption))
+        )
+    ops.append(
+        b"BT /F1 9 Tf %.1f %.1f Td (%s) Tj ET" % (x0, y0 - 60, _pdf_escape(token))
+    )
+    return b"\n".join(ops)
+
+
+def _build_pdf(contents: Iterable[bytes]) -> bytes:
+    contents = list(contents)
+    objects: List[bytes] = []
+
+    # 1 : catalog, 2 : pages, 3 : police, puis (page, contenu) pour chaque ticket
+    page_ids = [4 + 2 * i for i in range(len(contents))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects.append(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids)))
+    objects.append(
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    )
+    for pid, content in zip(page_ids, contents):
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, pid + 1)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, xref)
+    )
+    return out.getvalue()
+
+
+def render_pdf(tickets: Sequence[Tuple[str, str]]) -> bytes:
+    """tickets : liste de (token, légende). Les pages sont calculées en parallèle."""
+    return _build_pdf(_parallel_map(_pdf_page_content, list(tickets)))
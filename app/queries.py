@@ -0,0 +1,199 @@
+"""
+Requêtes de lecture partagées (chemin rapide, sans ORM).
+
+Les routes de liste exécutent un `select()` sur les seules colonnes utiles et
+renvoient des dicts : pas d'objets ORM (identity map, instrumentation des
+attributs), la validation Pydantic de la réponse part directement des lignes.
+"""
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi.responses import Response
+from sqlalchemy import or_, select
+from sqlalchemy.engine import Result
+from sqlalchemy.sql import Select
+
+from app import models
+
+# Colonnes exposées pour la jointure participant <-> ticket.
+# Le ticket d'un participant partage son token (Participant.qr_code == Ticket.qr_code_token).
+PARTICIPANT_COLUMNS: Dict[str, object] = {
+    "id": models.Participant.id,
+    "event_id": models.Participant.event_id,
+    "first_name": models.Participant.first_name,
+    "last_name": models.Participant.last_name,
+    "promo": models.Participant.promo,
+    "email": models.Participant.email,
+    "tarif": models.Participant.tarif,
+    "qr_code": models.Participant.qr_code,
+    "ticket_id": models.Ticket.id,
+    "status": models.Ticket.status,
+    "scanned_at": models.Ticket.scanned_at,
+}
+
+TICKET_COLUMNS: Dict[str, object] = {
+    "id": models.Ticket.id,
+    "event_id": models.Ticket.event_id,
+    "user_email": models.Ticket.user_email,
+    "user_name": models.Ticket.user_name,
+    "qr_code_token": models.Ticket.qr_code_token,
+    "status": models.Ticket.status,
+    "scanned_at": models.Ticket.scanned_at,
+}
+
+EVENT_COLUMNS: Dict[str, object] = {
+    "id": models.Event.id,
+    "name": models.Event.name,
+    "description": models.Event.description,
+    "date": models.Event.date,
+    "location": models.Event.location,
+    "email_subject": models.Event.email_subject,
+    "email_template": models.Event.email_template,
+}
+
+STUDENT_COLUMNS: Dict[str, object] = {
+    "id": models.Student.id,
+    "first_name": models.Student.first_name,
+    "last_name": models.Student.last_name,
+    "email": models.Student.email,
+    "is_external": models.Student.is_external,
+}
+
+
+def rows_as_dicts(result: Result) -> List[dict]:
+    """Lignes d'un select() -> dicts {colonne: valeur}, prêts pour la sérialisation."""
+    return [row._asdict() for row in result]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()  # même format que Pydantic
+    raise TypeError(f"{type(value).__name__} non sérialisable")
+
+
+def sparse_response(rows: List[dict]) -> Response:
+    """
+    Réponse JSON pour `?fields=` : les lignes ne contiennent que les colonnes
+    demandées, on les sérialise telles quelles (le response_model de la route,
+    qui rajouterait les autres champs à null, est court-circuité).
+    """
+    body = json.dumps(rows, default=_json_default, ensure_ascii=False, separators=(",", ":"))
+    return Response(content=body.encode("utf-8"), media_type="application/json")
+
+
+def parse_columns(raw: Optional[str], available: Dict[str, object]) -> List[str]:
+    """
+    Transforme "first_name,last_name" en liste de colonnes.
+    Lève ValueError si une colonne n'existe pas ; renvoie toutes les colonnes si raw est vide.
+    """
+    if not raw:
+        return list(available)
+
+    columns = [c.strip() for c in raw.split(",") if c.strip()]
+    unknown = [c for c in columns if c not in available]
+    if unknown:
+        raise ValueError(f"Colonnes inconnues : {', '.join(unknown)}")
+    # on garde l'ordre demandé, sans doublons
+    return list(dict.fromkeys(columns))
+
+
+# clés de tri acceptées par `sort` (préfixe "-" = ordre décroissant)
+PARTICIPANT_SORT_KEYS = ("last_name", "first_name", "promo", "tarif", "email", "status", "scanned_at", "id")
+DEFAULT_PARTICIPANT_SORT = ["last_name", "first_name"]
+
+
+def parse_sort(raw: Optional[str], allowed) -> List[str]:
+    """
+    Transforme "-scanned_at,last_name" en liste de clés de tri.
+    Lève ValueError si une clé n'est pas autorisée ; renvoie [] si raw est vide.
+    """
+    if not raw:
+        return []
+
+    keys = [k.strip() for k in raw.split(",") if k.strip()]
+    unknown = [k for k in keys if k.lstrip("-") not in allowed]
+    if unknown:
+        raise ValueError(f"Clés de tri inconnues : {', '.join(unknown)}")
+    return keys
+
+
+def _search_terms(q: str) -> List[str]:
+    # chaque mot doit apparaître dans le prénom, le nom ou l'email ; % et _ pris littéralement
+    return [
+        word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        for word in q.split()
+    ]
+
+
+def participant_select(
+    event_id: int,
+    columns: List[str],
+    status: Optional[str] = None,
+    tarif: Optional[str] = None,
+    promo: Optional[str] = None,
+    q: Optional[str] = None,
+    sort: Optional[List[str]] = None,
+) -> Select:
+    """
+    SELECT participants + ticket associé (une seule requête, jointure en SQL).
+    Tri par défaut : nom puis prénom (index ix_participants_event_name).
+    """
+    stmt = (
+        select(*[PARTICIPANT_COLUMNS[c].label(c) for c in columns])
+        .select_from(models.Participant)
+        .outerjoin(
+            models.Ticket,
+            models.Ticket.qr_code_token == models.Participant.qr_code,
+        )
+        .where(models.Participant.event_id == event_id)
+    )
+
+    if status:
+        stmt = stmt.where(models.Ticket.status == status)
+    if tarif:
+        stmt = stmt.where(models.Participant.tarif == tarif)
+    if promo:
+        stmt = stmt.where(models.Participant.promo == promo)
+    if q:
+        for term in _search_terms(q):
+            pattern = f"%{term}%"
+            stmt = stmt.where(
+                or_(
+                    models.Participant.first_name.ilike(pattern, escape="\\"),
+                    models.Participant.last_name.ilike(pattern, escape="\\"),
+                    models.Participant.email.ilike(pattern, escape="\\"),
+                )
+            )
+
+    order_by = []
+    for key in sort or DEFAULT_PARTICIPANT_SORT:
+        column = PARTICIPANT_COLUMNS[key.lstrip("-")]
+        order_by.append(column.desc() if key.startswith("-") else column.asc())
+    # départage stable (pagination)
+    order_by.append(models.Participant.id)
+    return stmt.order_by(*order_by)
+
+
+def ticket_select(
+    event_id: int,
+    columns: List[str],
+    status: Optional[str] = None,
+) -> Select:
+    stmt = (
+        select(*[TICKET_COLUMNS[c].label(c) for c in columns])
+        .where(models.Ticket.event_id == event_id)
+    )
+    if status:
+        stmt = stmt.where(models.Ticket.status == status)
+    return stmt.order_by(models.Ticket.id)
+
+
+def event_select(columns: Optional[List[str]] = None) -> Select:
+    columns = columns or list(EVENT_COLUMNS)
+    return select(*[EVENT_COLUMNS[c].label(c) for c in columns]).order_by(models.Event.id)
+
+
+def student_select(columns: Optional[List[str]] = None) -> Select:
+    columns = columns or list(STUDENT_COLUMNS)
+    return select(*[STUDENT_COLUMNS[c].label(c) for c in columns]).order_by(models.Student.id)
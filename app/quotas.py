@@ -0,0 +1,170 @@
+"""
+Capacité des events et quotas par tarif, table `event_quotas`.
+
+Une ligne compteur par limite posée :
+    - (event, "")     : capacité totale, compte les tickets de l'event ;
+    - (event, tarif)  : quota d'un tarif, compte les participants de ce tarif.
+Pas de ligne = pas de limite, et rien à tenir à jour.
+
+Chaque création réserve ses places dans sa propre transaction, par un UPDATE
+conditionnel sur le compteur :
+
+    UPDATE event_quotas SET used = used + :n
+    WHERE event_id = :event_id AND tarif = :tarif AND used + :n <= capacity
+
+Si le compteur existe mais n'a pas été modifié, il n'y a plus de place :
+QuotaExceeded est levée et la transaction est annulée (participants, tickets et
+compteurs déjà incrémentés). SQLite sérialise les écritures : deux créations
+simultanées ne peuvent pas dépasser la limite, sans COUNT(*) à chaque création ni
+verrou applicatif. Les lignes ne sont comptées qu'une fois, quand on pose une limite.
+"""
+from collections import Counter
+from typing import Iterable, List, Optional
+
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from app import models
+
+EVENT_CAPACITY = ""  # valeur de `tarif` pour la capacité totale
+
+_quotas = models.EventQuota.__table__
+
+_INCREMENT = (
+    update(_quotas)
+    .where(
+        _quotas.c.event_id == bindparam("b_event_id"),
+        _quotas.c.tarif == bindparam("b_tarif"),
+        _quotas.c.used + bindparam("n") <= _quotas.c.capacity,
+    )
+    .values(used=_quotas.c.used + bindparam("n"))
+)
+
+_DECREMENT = (
+    update(_quotas)
+    .where(
+        _quotas.c.event_id == bindparam("b_event_id"),
+        _quotas.c.tarif == bindparam("b_tarif"),
+    )
+    .values(used=func.max(_quotas.c.used - bindparam("n"), 0))
+)
+
+
+class QuotaExceeded(Exception):
+    """Plus assez de places (capacité de l'event ou quota d'un tarif)."""
+
+    def __init__(self, event_id: int, tarif: str, capacity: int, used: int, requested: int):
+        self.event_id = event_id
+        self.tarif = tarif or None
+        self.capacity = capacity
+        self.used = used
+        self.requested = requested
+        label = f"Quota du tarif {tarif} atteint" if tarif else "Capacité de l'event atteinte"
+        super().__init__(
+            f"{label} : {self.remaining} place(s) restante(s) sur {capacity}, {requested} demandée(s)"
+        )
+
+    @property
+    def remaining(self) -> int:
+        return max(self.capacity - self.used, 0)
+
+
+def _tarif_counts(tarifs: Iterable[Optional[str]]) -> Counter:
+    # participants sans tarif : seule la capacité totale les concerne
+    return Counter(tarif for tarif in tarifs if tarif)
+
+
+def reserve(conn, event_id: int, tickets: int, tarifs: Iterable[Optional[str]] = ()) -> None:
+    """
+    Réserve `tickets` places sur la capacité de l'event et une place par élément de
+    `tarifs` sur le quota correspondant. `conn` : Session ou Connection de la
+    transaction qui crée les lignes. Lève QuotaExceeded (sans rien annuler :
+    c'est le rollback de la transaction qui rend les places déjà réservées).
+    """
+    counts = {EVENT_CAPACITY: tickets, **_tarif_counts(tarifs)}
+    for tarif, n in counts.items():
+        if n <= 0:
+            continue
+        params = {"b_event_id": event_id, "b_tarif": tarif, "n": n}
+        if conn.execute(_INCREMENT, params).rowcount:
+            continue
+        row = conn.execute(
+            select(_quotas.c.capacity, _quotas.c.used).where(
+                _quotas.c.event_id == event_id, _quotas.c.tarif == tarif
+            )
+        ).first()
+        if row is not None:
+            raise QuotaExceeded(event_id, tarif, row.capacity, row.used, n)
+
+
+def release(conn, event_id: int, tickets: int, tarifs: Iterable[Optional[str]] = ()) -> None:
+    """Rend les places de tickets / participants supprimés (inverse de reserve)."""
+    counts = {EVENT_CAPACITY: tickets, **_tarif_counts(tarifs)}
+    params = [
+        {"b_event_id": event_id, "b_tarif": tarif, "n": n}
+        for tarif, n in counts.items()
+        if n > 0
+    ]
+    if params:
+        conn.execute(_DECREMENT, params)
+
+
+def change_tarif(conn, event_id: int, old: Optional[str], new: Optional[str]) -> None:
+    """Participant qui change de tarif : la place passe d'un quota à l'autre."""
+    if (old or None) == (new or None):
+        return
+    release(conn, event_id, 0, [old])
+    reserve(conn, event_id, 0, [new])
+
+
+def set_limit(conn, event_id: int, tarif: Optional[str], capacity: Optional[int]) -> None:
+    """
+    Pose (ou retire si capacity est None) la capacité de l'event (tarif None) ou le
+    quota d'un tarif. Le compteur est initialisé par un COUNT fait dans la même
+    requête que son écriture. Une limite inférieure à l'existant est acceptée :
+    elle bloque seulement les nouvelles inscriptions.
+    """
+    tarif = tarif or EVENT_CAPACITY
+    if capacity is None:
+        conn.execute(
+            delete(_quotas).where(_quotas.c.event_id == event_id, _quotas.c.tarif == tarif)
+        )
+        return
+
+    if tarif == EVENT_CAPACITY:
+        used = select(func.count()).where(models.Ticket.event_id == event_id)
+    else:
+        used = select(func.count()).where(
+            models.Participant.event_id == event_id,
+            models.Participant.tarif == tarif,
+        )
+    stmt = insert(_quotas).values(
+        event_id=event_id,
+        tarif=tarif,
+        capacity=capacity,
+        used=used.scalar_subquery(),
+    )
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["event_id", "tarif"],
+            set_={"capacity": stmt.excluded.capacity, "used": stmt.excluded.used},
+        )
+    )
+
+
+def list_limits(conn, event_id: int) -> List[dict]:
+    """Limites de l'event (capacité totale en premier) avec places utilisées et restantes."""
+    rows = conn.execute(
+        select(_quotas.c.tarif, _quotas.c.capacity, _quotas.c.used)
+        .where(_quotas.c.event_id == event_id)
+        .order_by(_quotas.c.tarif)
+    )
+    return [
+        {
+            "tarif": row.tarif or None,
+            "capacity": row.capacity,
+            "used": row.used,
+            "remaining": max(row.capacity - row.used, 0),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,187 @@
+"""
+Limitation de débit et délestage (middleware ASGI), entièrement en mémoire.
+
+Chaque requête est rattachée à une classe de routes (login, scan, search...).
+Pour chaque classe :
+    - un seau à jetons par client (adresse IP) et, si la requête porte un token
+      Bearer, par utilisateur : dépassement -> 429 + Retry-After ;
+    - un plafond de requêtes simultanées : dépassement -> 503 immédiat, pour que
+      la file d'attente ne dégrade pas la latence du scan.
+
+Un seau ne stocke que (jetons, dernière mise à jour) : mémoire O(1) par clé
+active. Les seaux pleins (clés inactives) sont purgés régulièrement.
+Les limites sont propres au process (un jeu de seaux par worker).
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    name: str
+    path_prefix: str
+    methods: Tuple[str, ...]
+    rate: float          # jetons par seconde (par client / par utilisateur)
+    burst: int           # taille du seau
+    max_concurrent: int  # requêtes simultanées max pour toute la classe
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+# l'ordre compte : la première classe dont le préfixe correspond est utilisée
+ROUTE_CLASSES: List[RouteClass] = [
+    RouteClass(
+        "login", "/auth/login", ("POST",),
+        rate=_env_float("RATE_LOGIN_PER_SECOND", 0.5),
+        burst=int(_env_float("RATE_LOGIN_BURST", 10)),
+        max_concurrent=int(_env_float("RATE_LOGIN_CONCURRENCY", 4)),    # bcrypt = CPU
+    ),
+    RouteClass(
+        "scan", "/scan", ("POST",),
+        # plusieurs téléphones d'une même porte partagent souvent la même IP (wifi / NAT)
+        rate=_env_float("RATE_SCAN_PER_SECOND", 20),
+        burst=int(_env_float("RATE_SCAN_BURST", 60)),
+        max_concurrent=int(_env_float("RATE_SCAN_CONCURRENCY", 32)),
+    ),
+    RouteClass(
+        "search", "/students/search", ("GET",),
+        rate=_env_float("RATE_SEARCH_PER_SECOND", 5),
+        burst=int(_env_float("RATE_SEARCH_BURST", 20)),
+        max_concurrent=int(_env_float("RATE_SEARCH_CONCURRENCY", 8)),
+    ),
+]
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# purge des seaux inactifs toutes les N secondes
+CLEANUP_INTERVAL_SECONDS = 60
+
+
+class TokenBuckets:
+    """Seaux à jetons indexés par clé ; chaque seau = [jetons, horodatage]."""
+
+    def __init__(self):
+        self._buckets: Dict[tuple, List[float]] = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = time.monotonic()
+
+    def take(self, key: tuple, rate: float, burst: int) -> float:
+        """Consomme un jeton. Renvoie 0 si accepté, sinon le délai (s) avant le prochain jeton."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(burst), now]
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if now - self._last_cleanup > CLEANUP_INTERVAL_SECONDS:
+                self._cleanup(now)
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate
+
+    def _cleanup(self, now: float) -> None:
+        # un seau inactif depuis assez longtemps serait plein : inutile de le garder
+        idle = [
+            key for key, (tokens, updated) in self._buckets.items()
+            if now - updated > CLEANUP_INTERVAL_SECONDS
+        ]
+        for key in idle:
+            del self._buckets[key]
+        self._last_cleanup = now
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, route_classes: Optional[List[RouteClass]] = None):
+        self.app = app
+        self.route_classes = route_classes if route_classes is not None else ROUTE_CLASSES
+        self.buckets = TokenBuckets()
+        self._in_flight: Dict[str, int] = {rc.name: 0 for rc in self.route_classes}
+        self._lock = threading.Lock()
+
+    def _classify(self, scope: Scope) -> Optional[RouteClass]:
+        path = scope["path"]
+        for route_class in self.route_classes:
+            if scope["method"] in route_class.methods and path.startswith(route_class.path_prefix):
+                return route_class
+        return None
+
+    @staticmethod
+    def _client_keys(scope: Scope) -> List[str]:
+        keys = []
+        client = scope.get("client")
+        keys.append("ip:" + (client[0] if client else "unknown"))
+        for name, value in scope["headers"]:
+            if name == b"authorization" and value.lower().startswith(b"bearer "):
+                # on ne décode pas le JWT ici : son hash suffit à identifier l'utilisateur
+                keys.append("user:" + hashlib.sha1(value[7:]).hexdigest())
+                break
+        return keys
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self._classify(scope)
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = 0.0
+        for key in self._client_keys(scope):
+            retry_after = max(
+                retry_after,
+                self.buckets.take((route_class.name, key), route_class.rate, route_class.burst),
+            )
+        if retry_after > 0:
+            await self._reject(send, 429, "Trop de requêtes, réessayez plus tard", retry_after)
+            return
+
+        with self._lock:
+            if self._in_flight[route_class.name] >= route_class.max_concurrent:
+                overloaded = True
+            else:
+                overloaded = False
+                self._in_flight[route_class.name] += 1
+        if overloaded:
+            await self._reject(send, 503, "Serveur surchargé, réessayez", 1)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            with self._lock:
+                self._in_flight[route_class.name] -= 1
+
+    @staticmethod
+    async def _reject(send: Send, status_code: int, detail: str, retry_after: float) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
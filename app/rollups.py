@@ -0,0 +1,131 @@
+"""
+Agrégats de présence : nombre de scans acceptés par (event, minute, porte, tarif),
+table `scan_rollups`.
+
+Les agrégats sont incrémentés dans la transaction qui marque le ticket SCANNED
+(scan direct ou flush du mode group commit) : ils restent exacts sans jamais
+relire les tickets. Les courbes d'arrivée se calculent sur quelques centaines de
+lignes par event, quel que soit le nombre de scans.
+
+Les minutes sont en UTC naïf (comme `tickets.scanned_at`) ; `Event.date` est une
+heure locale naïve (EVENT_TIMEZONE, défaut : fuseau du serveur) : `event_start_utc`
+la ramène en UTC avant toute comparaison avec les minutes.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app import models
+
+EVENT_TIMEZONE = os.getenv("EVENT_TIMEZONE", "")
+
+_rollups = models.ScanRollup.__table__
+
+
+def minute_of(moment: datetime) -> datetime:
+    return moment.replace(second=0, microsecond=0)
+
+
+def to_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """Datetime avec fuseau (paramètre ?since=...Z) -> UTC naïf ; naïf : déjà en UTC."""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def event_start_utc(date: Optional[datetime]) -> Optional[datetime]:
+    """Heure de début d'un event (heure locale naïve) en UTC naïf."""
+    if date is None or date.tzinfo is not None:
+        return to_utc(date)
+    if EVENT_TIMEZONE:
+        return to_utc(date.replace(tzinfo=ZoneInfo(EVENT_TIMEZONE)))
+    return to_utc(date.astimezone())  # naïf : heure locale du serveur
+
+
+def _increment_statement():
+    # tarif relu dans la même requête (participant qui porte le token), "" sinon
+    tarif = (
+        select(func.coalesce(models.Participant.tarif, ""))
+        .where(models.Participant.qr_code == bindparam("token"))
+        .scalar_subquery()
+    )
+    stmt = insert(_rollups).values(
+        event_id=bindparam("event_id"),
+        minute=bindparam("minute"),
+        gate=bindparam("gate"),
+        tarif=func.coalesce(tarif, ""),
+        scans=1,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["event_id", "minute", "gate", "tarif"],
+        set_={"scans": _rollups.c.scans + stmt.excluded.scans},
+    )
+
+
+_INCREMENT = _increment_statement()
+
+
+def record_scans(conn, scans: Iterable[dict]) -> None:
+    """
+    Compte des scans acceptés. `conn` : Session ou Connection de la transaction
+    qui les écrit. Chaque scan : {"event_id", "token", "scanned_at", "gate"}.
+    """
+    params = [
+        {
+            "event_id": scan["event_id"],
+            "token": scan["token"],
+            "minute": minute_of(scan["scanned_at"]),
+            "gate": scan.get("gate") or "",
+        }
+        for scan in scans
+    ]
+    if params:
+        conn.execute(_INCREMENT, params)
+
+
+def rebuild_rollups(conn, event_id: int) -> int:
+    """
+    Recalcule les agrégats d'un event depuis `tickets.scanned_at` (données antérieures
+    aux agrégats). La porte n'est pas connue dans les tickets : elle vaut "".
+    """
+    ticket = models.Ticket.__table__
+    participant = models.Participant.__table__
+    conn.execute(delete(_rollups).where(_rollups.c.event_id == event_id))
+
+    rows = conn.execute(
+        select(ticket.c.scanned_at, func.coalesce(participant.c.tarif, "").label("tarif"))
+        .select_from(ticket.outerjoin(participant, participant.c.qr_code == ticket.c.qr_code_token))
+        .where(
+            ticket.c.event_id == event_id,
+            ticket.c.status == "SCANNED",
+            ticket.c.scanned_at.is_not(None),
+        )
+    )
+    counts: dict = {}
+    for scanned_at, tarif in rows:
+        key = (minute_of(scanned_at), tarif)
+        counts[key] = counts.get(key, 0) + 1
+
+    if counts:
+        conn.execute(
+            _rollups.insert(),
+            [
+                {"event_id": event_id, "minute": minute, "gate": "", "tarif": tarif, "scans": scans}
+                for (minute, tarif), scans in counts.items()
+            ],
+        )
+    return sum(counts.values())
+
+
+def rollup_filters(event_id: int, since: Optional[datetime], until: Optional[datetime]) -> list:
+    since, until = to_utc(since), to_utc(until)
+    filters = [_rollups.c.event_id == event_id]
+    if since is not None:
+        filters.append(_rollups.c.minute >= minute_of(since))
+    if until is not None:
+        filters.append(_rollups.c.minute < until)
+    return filters
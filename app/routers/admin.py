@@ -38,7 +38,7 @@ def _check_user_can_manage_event(
 def add_admin_to_event(
     event_id: int,
     body: dict,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: models.User = Depends(get_current_user),
 ):
     """
@@ -82,8 +82,7 @@ def add_admin_to_event(
         role=role,
     )
     db.add(rel)
-    db.commit()
-    db.refresh(rel)
+    db.flush()
 
     return {
         "message": "Admin ajouté",
@@ -96,7 +95,7 @@ def add_admin_to_event(
 @router.get("/")
 def list_event_admins(
     event_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: models.User = Depends(get_current_user),
 ):
     event = db.query(models.Event).filter(models.Event.id == event_id).first()
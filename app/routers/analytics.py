@@ -0,0 +1,224 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db import get_db
+from app import models, schemas
+from app.deps import get_current_user
+from app.rollups import event_start_utc, minute_of, rebuild_rollups, rollup_filters, to_utc
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+# Toutes les routes lisent la table scan_rollups (une ligne par minute / porte / tarif) :
+# le coût dépend de la durée de l'event, pas du nombre de scans.
+
+_EPOCH = datetime(1970, 1, 1)
+GROUP_BY_COLUMNS = {
+    "gate": models.ScanRollup.gate,
+    "tarif": models.ScanRollup.tarif,
+}
+
+
+def _get_event_or_404(event_id: int, db: Session) -> models.Event:
+    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event non trouvé")
+    return event
+
+
+def _bucket_start(minute: datetime, bucket_minutes: int) -> datetime:
+    minutes = int((minute - _EPOCH).total_seconds() // 60)
+    return _EPOCH + timedelta(minutes=minutes - minutes % bucket_minutes)
+
+
+def _per_minute(db: Session, event_id: int, since=None, until=None) -> List[tuple]:
+    """[(minute, scans)] triés, toutes portes et tous tarifs confondus."""
+    rollup = models.ScanRollup
+    return (
+        db.query(rollup.minute, func.sum(rollup.scans))
+        .filter(*rollup_filters(event_id, since, until))
+        .group_by(rollup.minute)
+        .order_by(rollup.minute)
+        .all()
+    )
+
+
+def _counts_by(db: Session, event_id: int, column) -> List[schemas.AttendanceCount]:
+    rollup = models.ScanRollup
+    return [
+        schemas.AttendanceCount(key=key or None, scans=scans)
+        for key, scans in (
+            db.query(column, func.sum(rollup.scans))
+            .filter(rollup.event_id == event_id)
+            .group_by(column)
+            .order_by(func.sum(rollup.scans).desc())
+        )
+    ]
+
+
+@router.get("/events/{event_id}/timeline", response_model=schemas.AttendanceTimeline)
+def attendance_timeline(
+    event_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    bucket_minutes: int = Query(1, ge=1, le=24 * 60),
+    group_by: Optional[str] = Query(None, description="gate ou tarif (défaut : total)"),
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Entrées par tranche (débit par minute) et cumul, éventuellement par porte ou par tarif."""
+    _get_event_or_404(event_id, db)
+    if group_by is not None and group_by not in GROUP_BY_COLUMNS:
+        raise HTTPException(status_code=400, detail="group_by doit valoir gate ou tarif")
+    since, until = to_utc(since), to_utc(until)
+    if since is not None and until is not None and since >= until:
+        raise HTTPException(status_code=400, detail="since doit précéder until")
+
+    rollup = models.ScanRollup
+    key_column = GROUP_BY_COLUMNS.get(group_by)
+    columns = [rollup.minute, func.sum(rollup.scans)]
+    group = [rollup.minute]
+    if key_column is not None:
+        columns.insert(1, key_column)
+        group.append(key_column)
+
+    # le cumul part des entrées antérieures à la fenêtre (qui commence à la minute de since)
+    cumulative = defaultdict(int)
+    if since is not None:
+        before = db.query(*columns[1:]).filter(
+            rollup.event_id == event_id, rollup.minute < minute_of(since)
+        )
+        if key_column is not None:
+            for key, scans in before.group_by(key_column):
+                cumulative[key] = scans
+        else:
+            cumulative[""] = before.scalar() or 0
+
+    buckets = defaultdict(int)
+    for row in (
+        db.query(*columns)
+        .filter(*rollup_filters(event_id, since, until))
+        .group_by(*group)
+    ):
+        minute, scans = row[0], row[-1]
+        key = row[1] if key_column is not None else ""
+        buckets[(_bucket_start(minute, bucket_minutes), key)] += scans
+
+    points = []
+    for (start, key), scans in sorted(buckets.items()):
+        cumulative[key] += scans
+        points.append(
+            schemas.AttendancePoint(
+                bucket_start=start,
+                key=key or None,
+                scans=scans,
+                per_minute=scans / bucket_minutes,
+                cumulative=cumulative[key],
+            )
+        )
+
+    return schemas.AttendanceTimeline(
+        event_id=event_id,
+        bucket_minutes=bucket_minutes,
+        group_by=group_by,
+        points=points,
+    )
+
+
+@router.get("/events/{event_id}/summary", response_model=schemas.AttendanceSummary)
+def attendance_summary(
+    event_id: int,
+    top: int = Query(5, ge=1, le=100, description="Nombre de minutes de pointe renvoyées"),
+    window_minutes: int = Query(15, ge=1, le=24 * 60, description="Durée de la fenêtre de pointe"),
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Total des entrées, minutes de pointe, fenêtre glissante la plus chargée, répartition."""
+    _get_event_or_404(event_id, db)
+    minutes = _per_minute(db, event_id)
+
+    peak_window = None
+    if minutes:
+        # fenêtre glissante [start, start + window_minutes[ sur les minutes triées
+        best_start, best_scans, in_window, left = None, -1, 0, 0
+        for minute, scans in minutes:
+            in_window += scans
+            while minutes[left][0] <= minute - timedelta(minutes=window_minutes):
+                in_window -= minutes[left][1]
+                left += 1
+            if in_window > best_scans:
+                best_start, best_scans = minutes[left][0], in_window
+        peak_window = schemas.PeakWindow(start=best_start, minutes=window_minutes, scans=best_scans)
+
+    peaks = sorted(minutes, key=lambda m: (-m[1], m[0]))[:top]
+    return schemas.AttendanceSummary(
+        event_id=event_id,
+        total=sum(scans for _, scans in minutes),
+        first_minute=minutes[0][0] if minutes else None,
+        last_minute=minutes[-1][0] if minutes else None,
+        peak_minutes=[schemas.PeakMinute(minute=m, scans=s) for m, s in peaks],
+        peak_window=peak_window,
+        by_gate=_counts_by(db, event_id, models.ScanRollup.gate),
+        by_tarif=_counts_by(db, event_id, models.ScanRollup.tarif),
+    )
+
+
+@router.get("/compare", response_model=list[schemas.EventCurve])
+def compare_events(
+    event_ids: List[int] = Query(..., description="Ex: ?event_ids=1&event_ids=2"),
+    bucket_minutes: int = Query(5, ge=1, le=24 * 60),
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Courbes d'arrivée de plusieurs events, alignées sur l'heure de début de chaque
+    event (ramenée en UTC, comme les minutes des scans).
+    """
+    if len(event_ids) > 20:
+        raise HTTPException(status_code=400, detail="20 events maximum")
+
+    curves = []
+    for event_id in dict.fromkeys(event_ids):
+        event = _get_event_or_404(event_id, db)
+        minutes = _per_minute(db, event_id)
+        total = sum(scans for _, scans in minutes)
+        origin = event_start_utc(event.date) or (minutes[0][0] if minutes else None)
+
+        buckets = defaultdict(int)
+        for minute, scans in minutes:
+            offset = int((minute - origin).total_seconds() // 60)
+            buckets[offset - offset % bucket_minutes] += scans
+
+        points = []
+        cumulative = 0
+        for offset, scans in sorted(buckets.items()):
+            cumulative += scans
+            points.append(
+                schemas.CurvePoint(
+                    offset_minutes=offset,
+                    scans=scans,
+                    cumulative=cumulative,
+                    cumulative_ratio=cumulative / total,
+                )
+            )
+        curves.append(
+            schemas.EventCurve(event_id=event_id, name=event.name, date=event.date, total=total, points=points)
+        )
+    return curves
+
+
+@router.post("/events/{event_id}/rebuild")
+def rebuild_event_rollups(
+    event_id: int,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Recalcule les agrégats d'un event depuis les tickets (scans antérieurs aux agrégats)."""
+    if not current_user.is_superadmin:
+        raise HTTPException(status_code=403, detail="Réservé aux superadmins")
+    _get_event_or_404(event_id, db)
+    return {"event_id": event_id, "scans": rebuild_rollups(db, event_id)}
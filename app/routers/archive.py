@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+
+from app import models, schemas
+from app.archive import archive_events_before, get_archive_engine
+from app.deps import get_current_user
+from app.queries import PARTICIPANT_COLUMNS, TICKET_COLUMNS, participant_select, rows_as_dicts, ticket_select
+
+router = APIRouter(prefix="/archive", tags=["archive"])
+
+
+def _require_superadmin(current_user: models.User) -> None:
+    if not current_user.is_superadmin:
+        raise HTTPException(status_code=403, detail="Réservé aux superadmins")
+
+
+def _archive_engine_or_404():
+    archive_engine = get_archive_engine()
+    if archive_engine is None:
+        raise HTTPException(status_code=404, detail="Aucune archive")
+    return archive_engine
+
+
+@router.post("/events", response_model=schemas.ArchiveResult)
+def archive_events(
+    before: datetime = Query(..., description="Archive les events dont la date est antérieure"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Déplace les anciens events (et toutes leurs lignes liées) dans le fichier d'archive."""
+    _require_superadmin(current_user)
+    return {"cutoff": before, "moved": archive_events_before(before)}
+
+
+# Les lectures utilisent les mêmes requêtes que la base principale :
+# les tables de l'archive ont les mêmes noms et colonnes.
+
+@router.get("/events", response_model=list[schemas.EventOut])
+def list_archived_events(current_user: models.User = Depends(get_current_user)):
+    _require_superadmin(current_user)
+    events = models.Event.__table__
+    with _archive_engine_or_404().connect() as conn:
+        rows = rows_as_dicts(conn.execute(select(events).order_by(events.c.date, events.c.id)))
+    return rows
+
+
+@router.get("/events/{event_id}/participants", response_model=list[schemas.ParticipantOut])
+def list_archived_participants(
+    event_id: int,
+    current_user: models.User = Depends(get_current_user),
+):
+    _require_superadmin(current_user)
+    with _archive_engine_or_404().connect() as conn:
+        rows = rows_as_dicts(conn.execute(participant_select(event_id, list(PARTICIPANT_COLUMNS))))
+    return rows
+
+
+@router.get("/events/{event_id}/tickets", response_model=list[schemas.TicketOut])
+def list_archived_tickets(
+    event_id: int,
+    current_user: models.User = Depends(get_current_user),
+):
+    _require_superadmin(current_user)
+    with _archive_engine_or_404().connect() as conn:
+        rows = rows_as_dicts(conn.execute(ticket_select(event_id, list(TICKET_COLUMNS))))
+    return rows
@@ -11,7 +11,7 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/signup", response_model=schemas.UserOut)
-def signup(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
+def signup(user_in: schemas.UserCreate, db: Session = Depends(get_db, scope="function")):
     # check si email déjà utilisé
     existing = db.query(models.User).filter(models.User.email == user_in.email).first()
     if existing:
@@ -24,15 +24,14 @@ def signup(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
         is_superadmin=False,  # à éditer à la main en BDD si besoin
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    db.flush()
     return user
 
 
 @router.post("/login", response_model=schemas.Token)
 def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
     # OAuth2PasswordRequestForm fournit username + password
     user = db.query(models.User).filter(models.User.email == form_data.username).first()
@@ -1,17 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from typing import Optional
 
 from app.db import get_db
 from app import models, schemas
+from app.archive import delete_events
+from app.cache_bus import LocalCache, cache_bus
+from app.queries import EVENT_COLUMNS, event_select, parse_columns, rows_as_dicts, sparse_response
 from app.deps import get_current_user
 
 router = APIRouter(prefix="/events", tags=["events"])
 
+# lectures d'events propres au worker, invalidées par cache_bus.bump(db, "events")
+_event_cache = LocalCache("events", max_entries=512)
+
 
 @router.post("/", response_model=schemas.EventOut)
 def create_event(
     event_in: schemas.EventCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: models.User = Depends(get_current_user),
 ):
     event = models.Event(
@@ -20,10 +27,12 @@ def create_event(
         date=event_in.date,
         location=event_in.location,
         created_by_id=current_user.id,
+        email_subject=event_in.email_subject,
+        email_template=event_in.email_template,
     )
     db.add(event)
-    db.commit()
-    db.refresh(event)
+    cache_bus.bump(db, "events")
+    db.flush()
 
     # le créateur devient OWNER
     rel = models.EventAdmin(
@@ -32,22 +41,41 @@ def create_event(
         role="OWNER",
     )
     db.add(rel)
-    db.commit()
+    db.flush()
 
     return event
 
 
 @router.get("/", response_model=list[schemas.EventOut])
-def list_events(db: Session = Depends(get_db)):
-    events = db.query(models.Event).all()
-    return events
+def list_events(
+    fields: Optional[str] = Query(None, description="Colonnes à renvoyer, ex: id,name,date (défaut : toutes)"),
+    db: Session = Depends(get_db, scope="function"),
+):
+    try:
+        columns = parse_columns(fields, EVENT_COLUMNS)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    key = ("list", tuple(columns))
+    rows = _event_cache.get(key)
+    if rows is None:
+        version = _event_cache.version()
+        # lecture sans ORM : colonnes utiles -> dicts -> EventOut
+        rows = rows_as_dicts(db.execute(event_select(columns)))
+        _event_cache.set(key, rows, version)
+    return sparse_response(rows) if fields else rows
 
 
 @router.get("/{event_id}", response_model=schemas.EventOut)
-def get_event(event_id: int, db: Session = Depends(get_db)):
-    event = db.query(models.Event).filter(models.Event.id == event_id).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="Event non trouvé")
+def get_event(event_id: int, db: Session = Depends(get_db, scope="function")):
+    event = _event_cache.get(event_id)
+    if event is None:
+        version = _event_cache.version()
+        event = db.execute(event_select().where(models.Event.id == event_id)).first()
+        if not event:
+            raise HTTPException(status_code=404, detail="Event non trouvé")
+        event = event._asdict()
+        _event_cache.set(event_id, event, version)
     return event
 
 
@@ -55,7 +83,7 @@ def get_event(event_id: int, db: Session = Depends(get_db)):
 def update_event(
     event_id: int,
     event_in: schemas.EventCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: models.User = Depends(get_current_user),
 ):
     event = db.query(models.Event).filter(models.Event.id == event_id).first()
@@ -69,19 +97,22 @@ def update_event(
     event.description = event_in.description
     event.date = event_in.date
     event.location = event_in.location
-    # optional email_template field
-    if hasattr(event_in, 'email_template'):
-        event.email_template = getattr(event_in, 'email_template', None)
-
-    db.commit()
-    db.refresh(event)
+    # champs du mail optionnels : on ne les écrase que s'ils sont envoyés
+    provided = event_in.dict(exclude_unset=True)
+    if "email_subject" in provided:
+        event.email_subject = event_in.email_subject
+    if "email_template" in provided:
+        event.email_template = event_in.email_template
+
+    cache_bus.bump(db, "events")
+    db.flush()
     return event
 
 
 @router.delete("/{event_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_event(
     event_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: models.User = Depends(get_current_user),
 ):
     event = db.query(models.Event).filter(models.Event.id == event_id).first()
@@ -91,5 +122,5 @@ def delete_event(
     if event.created_by_id != current_user.id and not current_user.is_superadmin:
         raise HTTPException(status_code=403, detail="Accès refusé")
 
-    db.delete(event)
-    db.commit()
+    # tickets, participants, admins, mails et audit de scan : un DELETE par table
+    delete_events(db, [event_id])
@@ -0,0 +1,175 @@
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from app.db import engine, get_db
+from app import models
+from app.deps import get_current_user
+from app.queries import (
+    PARTICIPANT_COLUMNS,
+    TICKET_COLUMNS,
+    parse_columns,
+    participant_select,
+    ticket_select,
+)
+
+router = APIRouter(prefix="/events/{event_id}/export", tags=["exports"])
+
+# nombre de lignes lues à la fois depuis le curseur SQLite
+EXPORT_BATCH_SIZE = 1000
+# taille des morceaux renvoyés au client pour le XLSX
+XLSX_CHUNK_SIZE = 64 * 1024
+
+
+def _format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _iter_batches(stmt: Select) -> Iterator[list]:
+    """
+    Lit le résultat par paquets de EXPORT_BATCH_SIZE lignes.
+    On utilise une connexion dédiée : la session de la requête n'est pas
+    garantie d'être encore ouverte pendant le streaming de la réponse.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True,
+            yield_per=EXPORT_BATCH_SIZE,
+        ).execute(stmt)
+        for partition in result.partitions():
+            yield partition
+
+
+def _stream_csv(stmt: Select, columns: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    # même séparateur que l'import CSV des étudiants (Excel FR)
+    writer = csv.writer(buffer, delimiter=";")
+
+    # BOM pour qu'Excel détecte l'UTF-8
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+
+    for rows in _iter_batches(stmt):
+        writer.writerows([_format_value(v) for v in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    tail = buffer.getvalue()
+    if tail:
+        yield tail
+
+
+def _stream_xlsx(stmt: Select, columns: List[str], sheet_name: str) -> Iterator[bytes]:
+    from openpyxl import Workbook
+
+    # write_only : openpyxl écrit les lignes au fur et à mesure sur disque
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(columns)
+    for rows in _iter_batches(stmt):
+        for row in rows:
+            sheet.append([_format_value(v) for v in row])
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(XLSX_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def _export_response(event_id: int, name: str, stmt: Select, columns: List[str], format: str):
+    if format == "xlsx":
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise HTTPException(
+                status_code=501,
+                detail="Export XLSX indisponible (installer openpyxl)",
+            )
+        return StreamingResponse(
+            _stream_xlsx(stmt, columns, name),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={
+                "Content-Disposition": f'attachment; filename="event_{event_id}_{name}.xlsx"'
+            },
+        )
+
+    return StreamingResponse(
+        _stream_csv(stmt, columns),
+        media_type="text/csv; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="event_{event_id}_{name}.csv"'
+        },
+    )
+
+
+def _get_event_or_404(event_id: int, db: Session) -> models.Event:
+    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event non trouvé")
+    return event
+
+
+def _parse_columns_or_400(raw: Optional[str], available) -> List[str]:
+    try:
+        return parse_columns(raw, available)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/participants")
+def export_participants(
+    event_id: int,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    columns: Optional[str] = Query(
+        None,
+        description="Colonnes séparées par des virgules (toutes par défaut)",
+    ),
+    status: Optional[str] = Query(None, description="UNUSED / SCANNED / ..."),
+    tarif: Optional[str] = None,
+    promo: Optional[str] = None,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    _get_event_or_404(event_id, db)
+    selected = _parse_columns_or_400(columns, PARTICIPANT_COLUMNS)
+    stmt = participant_select(event_id, selected, status=status, tarif=tarif, promo=promo)
+    return _export_response(event_id, "participants", stmt, selected, format)
+
+
+@router.get("/tickets")
+def export_tickets(
+    event_id: int,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    columns: Optional[str] = Query(
+        None,
+        description="Colonnes séparées par des virgules (toutes par défaut)",
+    ),
+    status: Optional[str] = Query(None, description="UNUSED / SCANNED / ..."),
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    _get_event_or_404(event_id, db)
+    selected = _parse_columns_or_400(columns, TICKET_COLUMNS)
+    stmt = ticket_select(event_id, selected, status=status)
+    return _export_response(event_id, "tickets", stmt, selected, format)
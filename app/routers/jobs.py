@@ -0,0 +1,104 @@
+import json
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.db import get_db
+from app import models, schemas
+from app.deps import get_current_user
+from app.jobs import job_runner
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def job_to_out(job: models.Job) -> schemas.JobOut:
+    progress = None
+    eta_seconds = None
+    if job.total:
+        progress = min(job.processed / job.total, 1.0)
+        if job.status == "RUNNING" and job.started_at and job.processed:
+            elapsed = ((job.updated_at or datetime.utcnow()) - job.started_at).total_seconds()
+            eta_seconds = elapsed / job.processed * (job.total - job.processed)
+
+    return schemas.JobOut(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        priority=job.priority,
+        processed=job.processed or 0,
+        total=job.total,
+        progress=progress,
+        eta_seconds=eta_seconds,
+        error=job.error,
+        result=json.loads(job.result) if job.result else None,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+def _get_job_or_404(job_id: int, db: Session, current_user: models.User) -> models.Job:
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+    # les jobs sans créateur (ex : import CSV des étudiants, route non authentifiée)
+    # sont visibles par tout utilisateur connecté
+    if job.created_by_id not in (None, current_user.id) and not current_user.is_superadmin:
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    return job
+
+
+@router.post("/", response_model=schemas.JobOut, status_code=status.HTTP_202_ACCEPTED)
+def submit_job(
+    job_in: schemas.JobSubmit,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    try:
+        job = job_runner.submit(
+            db,
+            kind=job_in.kind,
+            payload=job_in.payload,
+            priority=job_in.priority,
+            created_by_id=current_user.id,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return job_to_out(job)
+
+
+@router.get("/", response_model=list[schemas.JobOut])
+def list_jobs(
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    query = db.query(models.Job)
+    if not current_user.is_superadmin:
+        query = query.filter(
+            or_(models.Job.created_by_id == current_user.id, models.Job.created_by_id.is_(None))
+        )
+    jobs = query.order_by(models.Job.id.desc()).limit(50).all()
+    return [job_to_out(j) for j in jobs]
+
+
+@router.get("/{job_id}", response_model=schemas.JobOut)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    return job_to_out(_get_job_or_404(job_id, db, current_user))
+
+
+@router.post("/{job_id}/cancel", response_model=schemas.JobOut)
+def cancel_job(
+    job_id: int,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    job = _get_job_or_404(job_id, db, current_user)
+    if job.status not in ("PENDING", "RUNNING"):
+        raise HTTPException(status_code=400, detail="Job déjà terminé")
+    return job_to_out(job_runner.cancel(db, job))
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db import after_commit, get_db
+from app import models, schemas
+from app.deps import get_current_user
+from app.mailer import mailer, render_message
+
+router = APIRouter(prefix="/events/{event_id}/mail", tags=["mail"])
+
+
+def _get_event_or_404(event_id: int, db: Session) -> models.Event:
+    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event non trouvé")
+    return event
+
+
+@router.post("/send", response_model=schemas.MailSendResult)
+def send_tickets(
+    event_id: int,
+    request: schemas.MailSendRequest,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Met en file le mail de chaque participant (rendu du modèle de l'event).
+    L'envoi lui-même est fait par les threads du mailer : la requête ne bloque pas.
+    """
+    event = _get_event_or_404(event_id, db)
+
+    query = db.query(models.Participant).filter(models.Participant.event_id == event_id)
+    if request.participant_ids is not None:
+        query = query.filter(models.Participant.id.in_(request.participant_ids))
+    participants = query.all()
+
+    existing = {
+        d.participant_id: d
+        for d in db.query(models.EmailDelivery).filter(models.EmailDelivery.event_id == event_id)
+    }
+
+    now = datetime.utcnow()
+    queued = 0
+    skipped_without_email = 0
+    skipped_already_sent = 0
+    for participant in participants:
+        if not participant.email:
+            skipped_without_email += 1
+            continue
+
+        delivery = existing.get(participant.id)
+        if delivery is not None and delivery.status in ("SENT", "SENDING", "PENDING") and not request.resend:
+            skipped_already_sent += 1
+            continue
+        if delivery is not None and delivery.status == "SENDING":
+            # déjà en cours d'envoi, on ne le remet pas en file
+            skipped_already_sent += 1
+            continue
+
+        subject, body = render_message(event, participant)
+        if delivery is None:
+            delivery = models.EmailDelivery(event_id=event_id, participant_id=participant.id)
+            db.add(delivery)
+        delivery.email = participant.email
+        delivery.subject = subject
+        delivery.body = body
+        delivery.qr_code = participant.qr_code
+        delivery.status = "PENDING"
+        delivery.attempts = 0
+        delivery.last_error = None
+        delivery.next_attempt_at = None
+        delivery.created_at = now
+        delivery.sent_at = None
+        queued += 1
+
+    if queued:
+        # les threads d'envoi ne voient les mails qu'une fois la requête commitée
+        after_commit(db, mailer.notify)
+
+    return schemas.MailSendResult(
+        queued=queued,
+        skipped_without_email=skipped_without_email,
+        skipped_already_sent=skipped_already_sent,
+    )
+
+
+@router.get("/status", response_model=schemas.MailStatus)
+def mail_status(
+    event_id: int,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    _get_event_or_404(event_id, db)
+
+    counts = dict(
+        db.query(models.EmailDelivery.status, func.count(models.EmailDelivery.id))
+        .filter(models.EmailDelivery.event_id == event_id)
+        .group_by(models.EmailDelivery.status)
+        .all()
+    )
+    deliveries = (
+        db.query(models.EmailDelivery)
+        .filter(models.EmailDelivery.event_id == event_id)
+        .order_by(models.EmailDelivery.participant_id)
+        .all()
+    )
+    return {"counts": counts, "deliveries": deliveries}
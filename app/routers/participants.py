@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import exists, func, insert, or_, select
 from sqlalchemy.orm import Session
-import secrets
-from typing import Dict, Optional
+from typing import Optional
 
-from app.db import get_db
+from app.db import after_commit, get_db
 from app import models, schemas
+from app.dedup import DEDUP_THRESHOLD, Person, dedup_keys, find_duplicates, find_matches, load_people
 from app.deps import get_current_user
+from app.qr_tokens import generate_token
+from app.quotas import QuotaExceeded, change_tarif, release, reserve
+from app.queries import PARTICIPANT_COLUMNS, PARTICIPANT_SORT_KEYS, parse_columns, parse_sort, participant_select, rows_as_dicts, sparse_response
+from app.scan_store import scan_store
 
 router = APIRouter(prefix="/events/{event_id}/participants", tags=["participants"])
 
@@ -31,8 +36,15 @@ def _get_participant_or_404(event_id: int, participant_id: int, db: Session) ->
     return participant
 
 
-def _generate_qr_code() -> str:
-    return secrets.token_urlsafe(16)
+def _generate_qr_code(event_id: int) -> str:
+    return generate_token(event_id)
+
+
+def _reserve_or_409(db: Session, event_id: int, tickets: int, tarifs: list) -> None:
+    try:
+        reserve(db, event_id, tickets, tarifs)
+    except QuotaExceeded as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
 
 
 def _participant_to_out(
@@ -56,40 +68,69 @@ def _participant_to_out(
 @router.get("/", response_model=list[schemas.ParticipantOut])
 def list_participants(
     event_id: int,
-    db: Session = Depends(get_db),
+    status: Optional[str] = Query(None, description="Statut du ticket (UNUSED, SCANNED...)"),
+    tarif: Optional[str] = None,
+    promo: Optional[str] = None,
+    q: Optional[str] = Query(None, description="Recherche dans le prénom, le nom et l'email"),
+    sort: Optional[str] = Query(None, description="Ex: last_name,-scanned_at (défaut : nom, prénom)"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = Query(None, description="Colonnes à renvoyer, ex: id,first_name,status (défaut : toutes)"),
+    db: Session = Depends(get_db, scope="function"),
     current_user: models.User = Depends(get_current_user),
 ):
     _get_event_or_404(event_id, db)
-    participants = (
-        db.query(models.Participant)
-        .filter(models.Participant.event_id == event_id)
-        .order_by(models.Participant.last_name)
-        .all()
+    try:
+        sort_keys = parse_sort(sort, PARTICIPANT_SORT_KEYS)
+        columns = parse_columns(fields, PARTICIPANT_COLUMNS)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # filtres, recherche, tri et jointure avec les tickets faits en SQL
+    stmt = participant_select(
+        event_id,
+        columns,
+        status=status,
+        tarif=tarif,
+        promo=promo,
+        q=q,
+        sort=sort_keys,
     )
-    qr_codes = [p.qr_code for p in participants]
-    tickets_by_qr: Dict[str, models.Ticket] = {}
-    if qr_codes:
-        tickets = (
-            db.query(models.Ticket)
-            .filter(models.Ticket.qr_code_token.in_(qr_codes))
-            .all()
-        )
-        tickets_by_qr = {t.qr_code_token: t for t in tickets}
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    if offset:
+        stmt = stmt.offset(offset)
 
-    return [
-        _participant_to_out(p, tickets_by_qr.get(p.qr_code))
-        for p in participants
-    ]
+    rows = rows_as_dicts(db.execute(stmt))
+    return sparse_response(rows) if fields else rows
 
 
-@router.post("/", response_model=schemas.ParticipantOut, status_code=status.HTTP_201_CREATED)
+@router.get("/duplicates", response_model=schemas.DuplicateReport)
+def participants_duplicates(
+    event_id: int,
+    threshold: float = Query(DEDUP_THRESHOLD, ge=0.5, le=1),
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Groupes de participants de l'event qui sont probablement la même personne."""
+    _get_event_or_404(event_id, db)
+    people = load_people(db, models.Participant, models.Participant.event_id == event_id)
+    return find_duplicates(people, threshold)
+
+
+@router.post("/", response_model=schemas.ParticipantCreated, status_code=status.HTTP_201_CREATED)
 def create_participant(
     event_id: int,
     participant_in: schemas.ParticipantCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: models.User = Depends(get_current_user),
 ):
     _get_event_or_404(event_id, db)
+    # doublons probables dans l'event : signalés dans la réponse, la création n'est pas bloquée
+    person = Person(None, participant_in.first_name, participant_in.last_name, participant_in.email)
+    matches = find_matches(db, models.Participant, [person], models.Participant.event_id == event_id)[0]
+    # place réservée avant les INSERT, dans la même transaction
+    _reserve_or_409(db, event_id, 1, [participant_in.tarif])
 
     participant = models.Participant(
         event_id=event_id,
@@ -98,11 +139,9 @@ def create_participant(
         promo=participant_in.promo,
         email=participant_in.email,
         tarif=participant_in.tarif,
-        qr_code=_generate_qr_code(),
+        qr_code=_generate_qr_code(event_id),
     )
     db.add(participant)
-    db.commit()
-    db.refresh(participant)
 
     ticket = models.Ticket(
         event_id=event_id,
@@ -112,10 +151,102 @@ def create_participant(
         status="UNUSED",
     )
     db.add(ticket)
-    db.commit()
-    db.refresh(ticket)
+    # participant + ticket insérés ensemble ; commit unique en fin de requête (get_db)
+    db.flush()
 
-    return _participant_to_out(participant, ticket)
+    return schemas.ParticipantCreated(
+        **_participant_to_out(participant, ticket).dict(),
+        possible_duplicates=matches[:5],
+    )
+
+
+@router.post("/enroll", response_model=schemas.EnrollResult)
+def enroll_students(
+    event_id: int,
+    request: schemas.EnrollRequest,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Inscrit en une seule transaction tous les étudiants qui correspondent aux filtres
+    (participant + ticket), en ignorant ceux déjà inscrits (même email).
+    """
+    _get_event_or_404(event_id, db)
+
+    student = models.Student
+    filters = []
+    if request.student_ids is not None:
+        filters.append(student.id.in_(request.student_ids))
+    if request.email_domain:
+        filters.append(student.email.ilike(f"%@{request.email_domain.lstrip('@')}"))
+    if request.is_external is not None:
+        filters.append(student.is_external == request.is_external)
+    if request.q:
+        like = f"%{request.q}%"
+        filters.append(
+            or_(
+                student.first_name.ilike(like),
+                student.last_name.ilike(like),
+                student.email.ilike(like),
+            )
+        )
+    if not filters:
+        raise HTTPException(status_code=400, detail="Au moins un filtre est requis")
+
+    # index (event_id, lower(email)) : même expression des deux côtés, sinon seul event_id sert
+    already_enrolled = exists().where(
+        models.Participant.event_id == event_id,
+        func.lower(models.Participant.email) == func.lower(student.email),
+    )
+    matching = db.execute(
+        select(func.count(student.id)).where(*filters)
+    ).scalar()
+    candidates = db.execute(
+        select(student.first_name, student.last_name, student.email)
+        .where(*filters, ~already_enrolled)
+        .order_by(student.id)
+    ).all()
+
+    if candidates:
+        # tout ou rien : l'inscription est refusée s'il n'y a pas de place pour tous
+        _reserve_or_409(db, event_id, len(candidates), [request.tarif] * len(candidates))
+        # les tokens sont signés (HMAC) : générés ici, puis deux INSERT multi-lignes
+        tokens = [generate_token(event_id) for _ in candidates]
+        db.execute(
+            insert(models.Participant.__table__),
+            [
+                {
+                    "event_id": event_id,
+                    "first_name": c.first_name,
+                    "last_name": c.last_name,
+                    "promo": request.promo,
+                    "email": c.email,
+                    "tarif": request.tarif,
+                    "qr_code": token,
+                    # INSERT sans ORM : clés de dedup.py calculées ici
+                    **dedup_keys(c.first_name, c.last_name, c.email),
+                }
+                for c, token in zip(candidates, tokens)
+            ],
+        )
+        db.execute(
+            insert(models.Ticket.__table__),
+            [
+                {
+                    "event_id": event_id,
+                    "user_email": c.email,
+                    "user_name": f"{c.first_name} {c.last_name}".strip(),
+                    "qr_code_token": token,
+                    "status": "UNUSED",
+                }
+                for c, token in zip(candidates, tokens)
+            ],
+        )
+
+    return schemas.EnrollResult(
+        enrolled=len(candidates),
+        skipped_already_enrolled=matching - len(candidates),
+    )
 
 
 @router.put("/{participant_id}", response_model=schemas.ParticipantOut)
@@ -123,17 +254,21 @@ def update_participant(
     event_id: int,
     participant_id: int,
     participant_in: schemas.ParticipantUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: models.User = Depends(get_current_user),
 ):
     _get_event_or_404(event_id, db)
     participant = _get_participant_or_404(event_id, participant_id, db)
 
-    for field, value in participant_in.dict(exclude_unset=True).items():
-        setattr(participant, field, value)
+    changes = participant_in.dict(exclude_unset=True)
+    if "tarif" in changes:
+        try:
+            change_tarif(db, event_id, participant.tarif, changes["tarif"])
+        except QuotaExceeded as exc:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
 
-    db.commit()
-    db.refresh(participant)
+    for field, value in changes.items():
+        setattr(participant, field, value)
 
     ticket = (
         db.query(models.Ticket)
@@ -143,7 +278,10 @@ def update_participant(
     if ticket:
         ticket.user_email = participant.email  # None si non fourni
         ticket.user_name = f"{participant.first_name} {participant.last_name}".strip()
-        db.commit()
+        # l'état en mémoire du scan est relu en base après le commit
+        qr_code = participant.qr_code
+        after_commit(db, lambda: scan_store.forget(qr_code))
+    db.flush()
 
     return _participant_to_out(participant, ticket)
 
@@ -152,7 +290,7 @@ def update_participant(
 def delete_participant(
     event_id: int,
     participant_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
     current_user: models.User = Depends(get_current_user),
 ):
     _get_event_or_404(event_id, db)
@@ -162,7 +300,13 @@ def delete_participant(
         .filter(models.Ticket.qr_code_token == participant.qr_code)
         .first()
     )
+    # mails en file ou déjà envoyés : plus rien à envoyer, et l'id peut être réutilisé
+    db.query(models.EmailDelivery).filter(
+        models.EmailDelivery.participant_id == participant.id
+    ).delete(synchronize_session=False)
     db.delete(participant)
     if ticket:
         db.delete(ticket)
-    db.commit()
+    release(db, event_id, 1 if ticket else 0, [participant.tarif])
+    qr_code = participant.qr_code
+    after_commit(db, lambda: scan_store.forget(qr_code))
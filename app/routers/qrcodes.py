@@ -0,0 +1,109 @@
+import io
+import re
+import zipfile
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from app.db import get_db
+from app import models
+from app.deps import get_current_user
+from app.qrcodes import MEDIA_TYPES, get_qr_image, qr_cache, render_many, render_pdf
+
+router = APIRouter(tags=["qrcodes"])
+
+# l'image d'un token ne change jamais : le navigateur peut la garder indéfiniment ;
+# "private" : le token est le billet, aucun cache partagé (proxy, CDN) ne doit la garder
+QR_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match : liste d'ETags, éventuellement faibles (W/"..." après compression)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def _safe_filename(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", text or "").strip("_")[:60]
+
+
+@router.get("/qr/{token}")
+def get_qr_code(
+    token: str,
+    format: str = Query("png", pattern="^(png|svg)$"),
+    scale: int = Query(8, ge=1, le=40),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db, scope="function"),
+):
+    # vérifié à chaque appel (index unique sur qr_code_token), même si l'image est en
+    # cache : un ticket supprimé ou archivé ne doit plus être servi
+    exists = (
+        db.query(models.Ticket.id)
+        .filter(models.Ticket.qr_code_token == token)
+        .first()
+    )
+    if not exists:
+        raise HTTPException(status_code=404, detail="Ticket non trouvé")
+    entry = qr_cache.get((token, format, scale))
+    if entry is None:
+        entry = get_qr_image(token, format, scale)
+
+    image, etag = entry
+    headers = {"Cache-Control": QR_CACHE_CONTROL, "ETag": f'"{etag}"'}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=image, media_type=MEDIA_TYPES[format], headers=headers)
+
+
+@router.get("/events/{event_id}/qr/bulk")
+def get_event_qr_codes(
+    event_id: int,
+    format: str = Query("zip", pattern="^(zip|pdf)$"),
+    image_format: str = Query("png", pattern="^(png|svg)$"),
+    scale: int = Query(8, ge=1, le=40),
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event non trouvé")
+
+    tickets = (
+        db.query(models.Ticket.id, models.Ticket.user_name, models.Ticket.qr_code_token)
+        .filter(models.Ticket.event_id == event_id)
+        .order_by(models.Ticket.user_name, models.Ticket.id)
+        .all()
+    )
+    if not tickets:
+        raise HTTPException(status_code=404, detail="Aucun ticket pour cet event")
+
+    if format == "pdf":
+        content = render_pdf([(t.qr_code_token, t.user_name or "") for t in tickets])
+        return Response(
+            content=content,
+            media_type="application/pdf",
+            headers={"Content-Disposition": f'attachment; filename="event_{event_id}_qrcodes.pdf"'},
+        )
+
+    images = render_many([t.qr_code_token for t in tickets], image_format, scale)
+    buffer = io.BytesIO()
+    # PNG déjà compressé : ZIP_STORED évite de recompresser pour rien
+    compression = zipfile.ZIP_STORED if image_format == "png" else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(buffer, "w", compression=compression) as archive:
+        for ticket, image in zip(tickets, images):
+            name = f"{ticket.id}_{_safe_filename(ticket.user_name)}.{image_format}"
+            archive.writestr(name, image)
+
+    return Response(
+        content=buffer.getvalue(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="event_{event_id}_qrcodes.zip"'},
+    )
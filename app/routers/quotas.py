@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.db import get_db
+from app import models, schemas
+from app.deps import get_current_user
+from app.quotas import list_limits, set_limit
+
+router = APIRouter(prefix="/events/{event_id}/quotas", tags=["quotas"])
+
+
+@router.get("/", response_model=list[schemas.QuotaOut])
+def list_quotas(
+    event_id: int,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event non trouvé")
+    return list_limits(db, event_id)
+
+
+@router.put("/", response_model=list[schemas.QuotaOut])
+def set_quota(
+    event_id: int,
+    quota: schemas.QuotaSet,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Pose ou retire (capacity null) la capacité de l'event ou le quota d'un tarif."""
+    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event non trouvé")
+
+    if event.created_by_id != current_user.id and not current_user.is_superadmin:
+        raise HTTPException(status_code=403, detail="Accès refusé")
+
+    set_limit(db, event_id, quota.tarif, quota.capacity)
+    return list_limits(db, event_id)
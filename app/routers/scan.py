@@ -1,20 +1,100 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import Integer, case, cast, func
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Optional
+import time
 
 from app.db import get_db
 from app import models, schemas
+from app.deps import get_current_user
+from app.qr_tokens import (
+    CURRENT_KEY_ID,
+    MAC_BYTES,
+    TOKEN_VERSION,
+    check_token,
+    token_event_id,
+    verification_keys,
+)
+from app.rollups import record_scans, to_utc
+from app.scan_audit import scan_audit
+from app.scan_store import TicketState, scan_store
 
 router = APIRouter(prefix="/scan", tags=["scan"])
 
 
+def _load_ticket_state(db: Session, token: str) -> Optional[TicketState]:
+    row = (
+        db.query(
+            models.Ticket.event_id,
+            models.Ticket.status,
+            models.Ticket.scanned_at,
+            models.Ticket.user_email,
+            models.Ticket.user_name,
+        )
+        .filter(models.Ticket.qr_code_token == token)
+        .first()
+    )
+    return TicketState(*row) if row else None
+
+
+def _scan_result(ticket, reason: Optional[str]) -> schemas.ScanResult:
+    if ticket is None:
+        return schemas.ScanResult(valid=False, reason=reason)
+    if reason == "wrong_event":
+        return schemas.ScanResult(valid=False, reason=reason, event_id=ticket.event_id)
+    return schemas.ScanResult(
+        valid=reason is None,
+        reason=reason,
+        user_email=ticket.user_email,
+        user_name=ticket.user_name,
+        event_id=ticket.event_id,
+        status=ticket.status,
+    )
+
+
 @router.post("/", response_model=schemas.ScanResult)
 def scan_ticket(
     payload: schemas.ScanRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
+    started = time.perf_counter()
+    result = _scan(payload, db)
+
+    # audit : simple dépôt dans une file mémoire, écrit en base par paquets
+    scan_audit.record(
+        token=payload.token,
+        valid=result.valid,
+        reason=result.reason,
+        event_id=result.event_id or payload.event_id or token_event_id(payload.token),
+        device_id=payload.device_id,
+        gate=payload.gate,
+        latency_ms=(time.perf_counter() - started) * 1000,
+    )
+    return result
+
+
+def _scan(payload: schemas.ScanRequest, db: Session) -> schemas.ScanResult:
     token = payload.token
 
+    # 0) Pré-validation sans base : token illisible, signature fausse ou mauvais event
+    reason = check_token(token, payload.event_id)
+    if reason is not None:
+        return schemas.ScanResult(
+            valid=False,
+            reason=reason,
+        )
+
+    # mode group commit : décision en mémoire, écriture en base groupée en arrière-plan
+    if scan_store.enabled:
+        ticket, reason = scan_store.scan(
+            token,
+            payload.event_id,
+            lambda: _load_ticket_state(db, token),
+            gate=payload.gate,
+        )
+        return _scan_result(ticket, reason)
+
     # 1) On cherche le ticket qui correspond au token
     ticket = (
         db.query(models.Ticket)
@@ -29,6 +109,14 @@ def scan_ticket(
             reason="ticket_not_found",
         )
 
+    # anciens tokens aléatoires : l'event n'est connu qu'après la lecture en base
+    if payload.event_id is not None and ticket.event_id != payload.event_id:
+        return schemas.ScanResult(
+            valid=False,
+            reason="wrong_event",
+            event_id=ticket.event_id,
+        )
+
     # 2) Si déjà scanné
     if ticket.status == "SCANNED":
         return schemas.ScanResult(
@@ -51,11 +139,24 @@ def scan_ticket(
             status=ticket.status,
         )
 
-    # 4) Ticket valide : on le marque comme scanné
-    ticket.status = "SCANNED"
-    ticket.scanned_at = datetime.utcnow()
-    db.commit()
+    # 4) Ticket valide : on le marque comme scanné.
+    # UPDATE conditionnel : si un autre scan (autre thread / worker) est passé
+    # entre-temps, aucune ligne n'est modifiée et on refuse.
+    scanned_at = datetime.utcnow()
+    updated = (
+        db.query(models.Ticket)
+        .filter(models.Ticket.id == ticket.id, models.Ticket.status == "UNUSED")
+        .update(
+            {"status": "SCANNED", "scanned_at": scanned_at},
+            synchronize_session=False,
+        )
+    )
     db.refresh(ticket)
+    if not updated:
+        return _scan_result(ticket, "already_scanned")
+
+    # agrégats de présence, dans la même transaction que le scan
+    record_scans(db, [{"event_id": ticket.event_id, "token": token, "scanned_at": scanned_at, "gate": payload.gate}])
 
     return schemas.ScanResult(
         valid=True,
@@ -66,10 +167,126 @@ def scan_ticket(
         status=ticket.status,
     )
 
+@router.get("/stats", response_model=schemas.ScanStats)
+def scan_stats(
+    event_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    bucket_minutes: int = 5,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Débit et taux de refus par porte sur une fenêtre de temps (par défaut : la dernière heure)."""
+    # created_at est en UTC naïf : ?since=...Z (avec fuseau) est converti avant de comparer
+    since, until = to_utc(since), to_utc(until)
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(hours=1)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since doit précéder until")
+    if bucket_minutes < 1:
+        raise HTTPException(status_code=400, detail="bucket_minutes doit être >= 1")
+
+    attempt = models.ScanAttempt
+    filters = [attempt.created_at >= since, attempt.created_at < until]
+    if event_id is not None:
+        filters.append(attempt.event_id == event_id)
+
+    accepted = func.sum(case((attempt.valid, 1), else_=0))
+    minutes = (until - since).total_seconds() / 60
+
+    gates = []
+    for gate, total, ok, avg_latency in (
+        db.query(attempt.gate, func.count(attempt.id), accepted, func.avg(attempt.latency_ms))
+        .filter(*filters)
+        .group_by(attempt.gate)
+        .order_by(attempt.gate)
+    ):
+        gates.append(
+            schemas.GateStats(
+                gate=gate,
+                total=total,
+                accepted=ok,
+                rejected=total - ok,
+                rejection_rate=(total - ok) / total,
+                per_minute=total / minutes,
+                avg_latency_ms=avg_latency,
+            )
+        )
+
+    # découpage en tranches de bucket_minutes (epoch arrondi, calculé par SQLite)
+    bucket_seconds = bucket_minutes * 60
+    epoch = cast(func.strftime("%s", attempt.created_at), Integer)
+    bucket = (epoch // bucket_seconds) * bucket_seconds
+    timeline = [
+        schemas.GateBucket(
+            bucket_start=datetime.utcfromtimestamp(int(start)),
+            gate=gate,
+            total=total,
+            accepted=ok,
+            rejected=total - ok,
+            rejection_rate=(total - ok) / total,
+        )
+        for start, gate, total, ok in (
+            db.query(bucket.label("bucket"), attempt.gate, func.count(attempt.id), accepted)
+            .filter(*filters)
+            .group_by("bucket", attempt.gate)
+            .order_by("bucket", attempt.gate)
+        )
+    ]
+
+    reasons = dict(
+        db.query(attempt.reason, func.count(attempt.id))
+        .filter(*filters, attempt.valid.is_(False))
+        .group_by(attempt.reason)
+        .all()
+    )
+
+    return schemas.ScanStats(
+        since=since,
+        until=until,
+        gates=gates,
+        timeline=timeline,
+        reasons=reasons,
+    )
+
+
+@router.get("/keys/{event_id}", response_model=schemas.ScanKeys)
+def get_scan_keys(
+    event_id: int,
+    db: Session = Depends(get_db, scope="function"),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Clés de l'event pour que les scanners pré-valident les tokens hors ligne."""
+    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event non trouvé")
+
+    if not current_user.is_superadmin:
+        # owner ou simple scanner de l'event
+        rel = (
+            db.query(models.EventAdmin)
+            .filter(
+                models.EventAdmin.event_id == event_id,
+                models.EventAdmin.user_id == current_user.id,
+            )
+            .first()
+        )
+        if rel is None:
+            raise HTTPException(status_code=403, detail="Accès refusé")
+
+    return schemas.ScanKeys(
+        event_id=event_id,
+        token_version=TOKEN_VERSION,
+        mac_bytes=MAC_BYTES,
+        current_kid=CURRENT_KEY_ID,
+        keys=verification_keys(event_id),
+    )
+
+
 @router.get("/debug_raw", tags=["tickets-debug"])
 def list_raw_tickets(
     event_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
     tickets = db.query(models.Ticket).filter(models.Ticket.event_id == event_id).all()
     # On renvoie tout brut pour debug (à ne pas garder en prod)
@@ -1,81 +1,215 @@
 # app/routers/students.py
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
+from typing import Optional
 from sqlalchemy import or_
 from .. import models, schemas
-from ..db import get_db
+from ..db import get_db, SessionLocal
+from ..dedup import DEDUP_THRESHOLD, Person, find_duplicates, find_matches, load_people
+from ..jobs import JobContext, job_handler, job_runner
+from ..queries import STUDENT_COLUMNS, parse_columns, rows_as_dicts, sparse_response, student_select
 import csv
-from sqlalchemy.exc import IntegrityError
 
 router = APIRouter(
     prefix="/students",
     tags=["students"],
 )
 
+# nombre de lignes insérées par transaction dans l'import en tâche de fond
+IMPORT_CHUNK_SIZE = 500
+# doublons probables détaillés dans le résultat d'un import (les suivants sont seulement comptés)
+IMPORT_DUPLICATES_LIMIT = 100
+
+
+def _possible_duplicates(db: Session, student: schemas.StudentCreate) -> list:
+    """Fiches ressemblantes déjà en base (cf. dedup.py), renvoyées avec la fiche créée."""
+    person = Person(None, student.first_name, student.last_name, student.email)
+    return find_matches(db, models.Student, [person])[0][:5]
+
+
 @router.get("/", response_model=list[schemas.Student])
-def list_students(db: Session = Depends(get_db)):
-    return db.query(models.Student).all()
+def list_students(
+    fields: Optional[str] = Query(None, description="Colonnes à renvoyer, ex: id,last_name,email (défaut : toutes)"),
+    db: Session = Depends(get_db, scope="function"),
+):
+    try:
+        columns = parse_columns(fields, STUDENT_COLUMNS)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
-@router.post("/", response_model=schemas.Student)
-def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)):
+    # lecture sans ORM : colonnes utiles -> dicts -> schemas.Student
+    rows = rows_as_dicts(db.execute(student_select(columns)))
+    return sparse_response(rows) if fields else rows
+
+@router.get("/duplicates", response_model=schemas.DuplicateReport)
+def students_duplicates(
+    threshold: float = Query(DEDUP_THRESHOLD, ge=0.5, le=1),
+    db: Session = Depends(get_db, scope="function"),
+):
+    """Groupes d'étudiants qui sont probablement la même personne."""
+    return find_duplicates(load_people(db, models.Student), threshold)
+
+
+@router.post("/", response_model=schemas.StudentCreated)
+def create_student(
+    student: schemas.StudentCreate,
+    db: Session = Depends(get_db, scope="function"),
+):
     # éviter les doublons d’email
     existing = db.query(models.Student).filter(
         models.Student.email == student.email
     ).first()
     if existing:
         raise HTTPException(status_code=400, detail="Email déjà enregistré")
+    possible_duplicates = _possible_duplicates(db, student)
 
     db_student = models.Student(**student.dict())
     db.add(db_student)
-    db.commit()
-    db.refresh(db_student)
+    db.flush()
+    db_student.possible_duplicates = possible_duplicates
     return db_student
 
 
+def _row_to_student(row: dict) -> models.Student:
+    first_name = row["first_name"].strip()
+    last_name  = row["last_name"].strip()
+    email      = row["email"].strip()
+
+    is_external = not (
+        email.endswith("@eleves.enpc.fr")
+        or email.endswith("@enpc.fr")
+    )
+
+    return models.Student(
+        first_name=first_name,
+        last_name=last_name,
+        email=email,
+        is_external=is_external,
+    )
+
+
+def _add_new_students(db: Session, students: list[models.Student], first_row: int = 1) -> tuple[int, int, list]:
+    """
+    Ajoute les étudiants dont l'email est inconnu ; renvoie (insérés, doublons ignorés,
+    doublons probables). Les doublons probables (casse, accents, alias d'email) sont
+    insérés mais signalés : {"row": n° de ligne, "email": ..., "matches": [...]}.
+    """
+    emails = [s.email for s in students]
+    existing = {
+        email
+        for (email,) in db.query(models.Student.email).filter(models.Student.email.in_(emails))
+    }
+    added = []
+    for row, student in enumerate(students, start=first_row):
+        if student.email in existing:
+            continue
+        # doublon à l'intérieur du fichier : seule la première ligne compte
+        existing.add(student.email)
+        db.add(student)
+        added.append((row, student))
+    # visibles par la vérification du paquet suivant (autoflush désactivé)
+    db.flush()
+
+    # une requête pour tout le paquet ; une paire n'est signalée que sur la fiche la plus récente
+    people = [Person(s.id, s.first_name, s.last_name, s.email) for _, s in added]
+    possible = []
+    for (row, student), matches in zip(added, find_matches(db, models.Student, people)):
+        matches = [m for m in matches if m["id"] < student.id]
+        if matches:
+            possible.append({"row": row, "email": student.email, "matches": matches[:5]})
+    return len(added), len(students) - len(added), possible
+
+
 @router.post("/import-csv")
 async def import_students_csv(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    background: bool = Query(False, description="Traiter l'import en tâche de fond (renvoie un job)"),
+    db: Session = Depends(get_db, scope="function"),
 ):
     content = await file.read()
     text = content.decode("utf-8")
+
+    if background:
+        job = job_runner.submit(
+            db,
+            kind="import_students_csv",
+            payload={"content": text},
+        )
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"job_id": job.id, "status": job.status},
+        )
+
     lines = text.splitlines()
 
     reader = csv.DictReader(lines, delimiter=";")
 
+    rows = list(reader)
     inserted = 0
     skipped_duplicates = 0
+    possible_duplicates = []
+    possible_count = 0
 
-    for row in reader:
-        first_name = row["first_name"].strip()
-        last_name  = row["last_name"].strip()
-        email      = row["email"].strip()
+    # doublons détectés par paquets (plus d'essai / rollback ligne par ligne) ;
+    # un seul commit pour tout le fichier, en fin de requête (get_db)
+    for offset in range(0, len(rows), IMPORT_CHUNK_SIZE):
+        chunk = [_row_to_student(row) for row in rows[offset:offset + IMPORT_CHUNK_SIZE]]
+        added, skipped, possible = _add_new_students(db, chunk, first_row=offset + 1)
+        inserted += added
+        skipped_duplicates += skipped
+        possible_count += len(possible)
+        possible_duplicates += possible[:IMPORT_DUPLICATES_LIMIT - len(possible_duplicates)]
 
-        is_external = not (
-            email.endswith("@eleves.enpc.fr")
-            or email.endswith("@enpc.fr")
-        )
+    return {
+        "inserted": inserted,
+        "skipped_duplicates": skipped_duplicates,
+        "possible_duplicates_count": possible_count,
+        "possible_duplicates": possible_duplicates,
+    }
 
-        student = models.Student(
-            first_name=first_name,
-            last_name=last_name,
-            email=email,
-            is_external=is_external,
-        )
 
-        db.add(student)
-        try:
-            db.commit()          # on essaie d’insérer
-            db.refresh(student)
-            inserted += 1
-        except IntegrityError:
-            db.rollback()        # doublon => on annule
-            skipped_duplicates += 1
-            continue
+@job_handler("import_students_csv", payload_model=schemas.StudentsImportJob)
+def _import_students_csv_job(ctx: JobContext):
+    rows = list(csv.DictReader(ctx.payload["content"].splitlines(), delimiter=";"))
+
+    # reprise éventuelle après un redémarrage
+    start = ctx.checkpoint.get("row", 0)
+    inserted = ctx.checkpoint.get("inserted", 0)
+    skipped_duplicates = ctx.checkpoint.get("skipped_duplicates", 0)
+    possible_count = ctx.checkpoint.get("possible_duplicates_count", 0)
+    possible_duplicates = ctx.checkpoint.get("possible_duplicates", [])
+
+    for offset in range(start, len(rows), IMPORT_CHUNK_SIZE):
+        chunk = [_row_to_student(row) for row in rows[offset:offset + IMPORT_CHUNK_SIZE]]
+        with SessionLocal() as db:
+            added, skipped, possible = _add_new_students(db, chunk, first_row=offset + 1)
+            inserted += added
+            skipped_duplicates += skipped
+            possible_count += len(possible)
+            possible_duplicates += possible[:IMPORT_DUPLICATES_LIMIT - len(possible_duplicates)]
+
+            # checkpoint commité avec le paquet : une reprise ne recompte rien
+            done = offset + len(chunk)
+            ctx.progress(
+                done,
+                total=len(rows),
+                checkpoint={
+                    "row": done,
+                    "inserted": inserted,
+                    "skipped_duplicates": skipped_duplicates,
+                    "possible_duplicates_count": possible_count,
+                    "possible_duplicates": possible_duplicates,
+                },
+                db=db,
+            )
+            db.commit()
 
     return {
         "inserted": inserted,
         "skipped_duplicates": skipped_duplicates,
+        "possible_duplicates_count": possible_count,
+        "possible_duplicates": possible_duplicates,
     }
 
 
@@ -84,7 +218,7 @@ async def import_students_csv(
 @router.get("/search", response_model=list[schemas.Student])
 def search_students(
     q: str = Query("", description="Fragment de nom, prénom ou email"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
     if not q:
         # on limite à 20 premiers si q vide
@@ -111,10 +245,10 @@ def search_students(
     )
 
 
-@router.post("/external", response_model=schemas.Student)
+@router.post("/external", response_model=schemas.StudentCreated)
 def create_external_student(
     student: schemas.StudentCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
     # éviter les doublons d’email
     existing = db.query(models.Student).filter(
@@ -122,6 +256,7 @@ def create_external_student(
     ).first()
     if existing:
         raise HTTPException(status_code=400, detail="Email déjà enregistré")
+    possible_duplicates = _possible_duplicates(db, student)
 
     db_student = models.Student(
         first_name=student.first_name,
@@ -130,6 +265,6 @@ def create_external_student(
         is_external=True,  # 👈 ici on force externe
     )
     db.add(db_student)
-    db.commit()
-    db.refresh(db_student)
+    db.flush()
+    db_student.possible_duplicates = possible_duplicates
     return db_student
\ No newline at end of file
@@ -1,42 +1,57 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from datetime import datetime
-import secrets
+from typing import Optional
 
-from app.db import get_db
+from app.db import get_db, SessionLocal
 from app import models, schemas
+from app.jobs import JobContext, job_handler
+from app.qr_tokens import generate_token
+from app.quotas import QuotaExceeded, reserve
+from app.queries import TICKET_COLUMNS, parse_columns, rows_as_dicts, sparse_response, ticket_select
 
 # On met l'id de l'event dans le prefix pour que les routes soient claires
 router = APIRouter(prefix="/events/{event_id}/tickets", tags=["tickets"])
 
+# nombre de tickets créés par transaction dans le job create_tickets_bulk
+BULK_JOB_CHUNK_SIZE = 500
 
-def generate_ticket_token() -> str:
-    """Génère un token aléatoire pour le ticket (ce sera ce qu'on mettra dans le QR code)"""
-    return secrets.token_urlsafe(16)
+
+def generate_ticket_token(event_id: int) -> str:
+    """Génère le token signé du ticket (ce sera ce qu'on mettra dans le QR code)"""
+    return generate_token(event_id)
+
+
+def _reserve_or_409(db: Session, event_id: int, tickets: int) -> None:
+    """Réserve les places sur la capacité de l'event (cf. quotas.py)."""
+    try:
+        reserve(db, event_id, tickets)
+    except QuotaExceeded as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
 
 
 @router.post("/", response_model=schemas.TicketOut)
 def create_ticket(
     event_id: int,
     data: schemas.TicketCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
     event = db.query(models.Event).filter(models.Event.id == event_id).first()
     if not event:
         raise HTTPException(status_code=404, detail="Event non trouvé")
 
+    _reserve_or_409(db, event_id, 1)
     ticket = models.Ticket(
         event_id=event_id,
         user_email=data.user_email,
         user_name=data.user_name,
-        qr_code_token=generate_ticket_token(),
+        qr_code_token=generate_ticket_token(event_id),
         status="UNUSED",
         scanned_at=None,
     )
 
     db.add(ticket)
-    db.commit()
-    db.refresh(ticket)
+    db.flush()
     return ticket
 
 
@@ -44,13 +59,15 @@ def create_ticket(
 def create_tickets_bulk(
     event_id: int,
     data: schemas.TicketsBulkCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope="function"),
 ):
     # Vérifier que l'event existe
     event = db.query(models.Event).filter(models.Event.id == event_id).first()
     if not event:
         raise HTTPException(status_code=404, detail="Event non trouvé")
 
+    # tout ou rien : un seul UPDATE conditionnel pour toute la liste
+    _reserve_or_409(db, event_id, len(data.attendees))
     created_tickets: list[models.Ticket] = []
 
     for attendee in data.attendees:
@@ -58,18 +75,15 @@ def create_tickets_bulk(
             event_id=event_id,
             user_email=attendee.user_email,
             user_name=attendee.user_name,
-            qr_code_token=generate_ticket_token(),
+            qr_code_token=generate_ticket_token(event_id),
             status="UNUSED",
             scanned_at=None,
         )
         db.add(ticket)
         created_tickets.append(ticket)
 
-    db.commit()
-
-    # Refresh pour avoir les IDs
-    for t in created_tickets:
-        db.refresh(t)
+    # flush pour avoir les IDs (commit unique en fin de requête, cf. get_db)
+    db.flush()
 
     return created_tickets
 
@@ -77,11 +91,53 @@ def create_tickets_bulk(
 @router.get("/", response_model=list[schemas.TicketOut])
 def list_tickets_for_event(
     event_id: int,
-    db: Session = Depends(get_db),
+    fields: Optional[str] = Query(None, description="Colonnes à renvoyer, ex: id,user_name,status (défaut : toutes)"),
+    db: Session = Depends(get_db, scope="function"),
 ):
     event = db.query(models.Event).filter(models.Event.id == event_id).first()
     if not event:
         raise HTTPException(status_code=404, detail="Event non trouvé")
 
-    tickets = db.query(models.Ticket).filter(models.Ticket.event_id == event_id).all()
-    return tickets
+    try:
+        columns = parse_columns(fields, TICKET_COLUMNS)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # lecture sans ORM : colonnes utiles -> dicts -> TicketOut
+    rows = rows_as_dicts(db.execute(ticket_select(event_id, columns)))
+    return sparse_response(rows) if fields else rows
+
+
+@job_handler("create_tickets_bulk", payload_model=schemas.TicketsBulkJob)
+def _create_tickets_bulk_job(ctx: JobContext):
+    event_id = ctx.payload["event_id"]
+    attendees = ctx.payload["attendees"]
+    start = ctx.checkpoint.get("index", 0)
+
+    with SessionLocal() as db:
+        event = db.query(models.Event).filter(models.Event.id == event_id).first()
+        if not event:
+            raise ValueError("Event non trouvé")
+
+    for offset in range(start, len(attendees), BULK_JOB_CHUNK_SIZE):
+        chunk = attendees[offset:offset + BULK_JOB_CHUNK_SIZE]
+        with SessionLocal() as db:
+            # QuotaExceeded : le paquet est annulé, le job échoue (paquets précédents gardés)
+            reserve(db, event_id, len(chunk))
+            db.add_all(
+                models.Ticket(
+                    event_id=event_id,
+                    user_email=attendee["user_email"],
+                    user_name=attendee["user_name"],
+                    qr_code_token=generate_ticket_token(event_id),
+                    status="UNUSED",
+                    scanned_at=None,
+                )
+                for attendee in chunk
+            )
+            # checkpoint dans la même transaction que le paquet et sa réservation
+            done = offset + len(chunk)
+            ctx.progress(done, total=len(attendees), checkpoint={"index": done}, db=db)
+            db.commit()
+
+    return {"event_id": event_id, "created": len(attendees)}
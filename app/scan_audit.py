@@ -0,0 +1,107 @@
+"""
+Audit des scans : chaque appel à /scan (accepté ou refusé) est enregistré dans
+la table `scan_attempts`.
+
+Le chemin du scan ne fait aucune écriture synchrone : il dépose l'entrée dans une
+file bornée en mémoire, vidée par paquets par un thread de fond. Si la file est
+pleine (base bloquée), les entrées sont abandonnées et comptées dans `dropped`
+plutôt que de ralentir l'entrée.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert
+
+from app.db import engine
+from app import models
+
+logger = logging.getLogger(__name__)
+
+SCAN_AUDIT_QUEUE_SIZE = int(os.getenv("SCAN_AUDIT_QUEUE_SIZE", "10000"))
+SCAN_AUDIT_BATCH_SIZE = int(os.getenv("SCAN_AUDIT_BATCH_SIZE", "500"))
+SCAN_AUDIT_FLUSH_MS = int(os.getenv("SCAN_AUDIT_FLUSH_MS", "200"))
+# longueur max du token enregistré (un token "poubelle" peut être arbitrairement long)
+MAX_TOKEN_LENGTH = 128
+
+
+class ScanAuditLog:
+    def __init__(self, max_size: int = SCAN_AUDIT_QUEUE_SIZE):
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scan-audit", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._write(self._drain(self._queue.qsize()))
+
+    def record(
+        self,
+        token: str,
+        valid: bool,
+        reason: Optional[str],
+        event_id: Optional[int],
+        device_id: Optional[str],
+        gate: Optional[str],
+        latency_ms: float,
+    ) -> None:
+        entry = {
+            "created_at": datetime.utcnow(),
+            "event_id": event_id,
+            "token": token[:MAX_TOKEN_LENGTH],
+            "valid": valid,
+            "reason": reason,
+            "device_id": device_id,
+            "gate": gate,
+            "latency_ms": latency_ms,
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, limit: int) -> list:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list) -> None:
+        if not batch:
+            return
+        with engine.begin() as conn:
+            conn.execute(insert(models.ScanAttempt.__table__), batch)
+
+    def _run(self) -> None:
+        interval = SCAN_AUDIT_FLUSH_MS / 1000
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self._write(self._drain(SCAN_AUDIT_BATCH_SIZE))
+            except Exception:
+                logger.exception("Écriture de l'audit des scans impossible")
+            # on repart tout de suite si la file est encore bien remplie
+            if self._queue.qsize() < SCAN_AUDIT_BATCH_SIZE:
+                self._stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+
+scan_audit = ScanAuditLog()
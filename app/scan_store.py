@@ -0,0 +1,335 @@
+"""
+Mode "group commit" du scan (optionnel, SCAN_GROUP_COMMIT=1).
+
+Sans ce mode, chaque scan accepté fait son propre commit SQLite (donc un fsync) :
+aux heures de pointe c'est la latence disque qui limite le débit à l'entrée.
+
+Avec ce mode :
+    - l'état des tickets déjà vus est gardé en mémoire (dictionnaire token -> état),
+      c'est lui qui fait foi ; la décision accepté / refusé est prise sous un verrou,
+      donc un ticket n'est jamais accepté deux fois par ce process ;
+    - chaque scan accepté est ajouté à un journal local (append-only) puis acquitté ;
+    - un thread écrit les scans en attente dans SQLite toutes les SCAN_FLUSH_INTERVAL_MS
+      millisecondes, en une seule transaction (UPDATE ... WHERE status = 'UNUSED') ;
+    - au démarrage, les journaux non encore appliqués sont rejoués.
+
+Le journal est écrit (write) à chaque scan : il survit à un crash du process.
+Avec SCAN_LOG_FSYNC=each il est aussi fsync-é à chaque scan (survit à une coupure
+de courant, au prix d'un fsync de fichier, plus léger qu'un commit SQLite).
+
+Un token reste "épinglé" en mémoire tant que son scan n'est pas commité en base
+(en attente, en cours d'écriture, ou dans un segment dont l'écriture a échoué et
+qui est retenté à chaque flush) : `forget` ne peut pas le faire relire UNUSED.
+
+L'état en mémoire est propre au process : le mode est refusé au démarrage s'il y
+a plusieurs workers (WEB_CONCURRENCY > 1, ou verrou du journal déjà pris par un
+autre process).
+"""
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows : seul WEB_CONCURRENCY est vérifié
+    fcntl = None
+import threading
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, update
+
+from app.db import engine
+from app import models
+from app.rollups import record_scans
+
+logger = logging.getLogger(__name__)
+
+SCAN_GROUP_COMMIT = os.getenv("SCAN_GROUP_COMMIT", "0") == "1"
+SCAN_FLUSH_INTERVAL_MS = int(os.getenv("SCAN_FLUSH_INTERVAL_MS", "5"))
+SCAN_LOG_PATH = os.getenv("SCAN_LOG_PATH", "./scan_journal.log")
+SCAN_LOG_FSYNC = os.getenv("SCAN_LOG_FSYNC", "batch")  # "batch" ou "each"
+
+
+# (token, heure du scan, porte)
+PendingScan = Tuple[str, datetime, Optional[str]]
+
+
+@dataclass(frozen=True)
+class TicketState:
+    event_id: int
+    status: str
+    scanned_at: Optional[datetime]
+    user_email: Optional[str]
+    user_name: Optional[str]
+
+
+class ScanStore:
+    def __init__(self, log_path: str = SCAN_LOG_PATH, enabled: bool = SCAN_GROUP_COMMIT):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.flushing_path = log_path + ".flushing"
+        self._tickets: Dict[str, TicketState] = {}
+        self._pending: List[PendingScan] = []
+        # tokens dont le scan n'est pas encore commité : jamais oubliés (cf. forget)
+        self._pinned: Set[str] = set()
+        # oublis demandés pendant que le token était épinglé, faits après le commit
+        self._forget_later: Set[str] = set()
+        # segments dont l'écriture a échoué : (chemin, scans), retentés à chaque flush
+        self._failed: List[Tuple[str, List[PendingScan]]] = []
+        self._lock_file = None
+        self._lock = threading.Lock()
+        # un seul flush à la fois (thread de fond ou arrêt du serveur)
+        self._flush_lock = threading.Lock()
+        self._log = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- cycle de vie ----------
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        if not self.enabled:
+            # journal laissé par un crash (mode activé auparavant) : rejoué par un seul
+            # worker, sous le verrou ; les autres le trouvent pris ou déjà vide
+            if self._lock_journal():
+                try:
+                    self._replay_logs()
+                finally:
+                    self._unlock_journal()
+            return
+        # verrou avant le rejeu : un 2e worker ne doit pas rejouer le journal du premier
+        self._acquire_single_worker()
+        self._replay_logs()
+        self._stop.clear()
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._flush_loop, name="scan-flusher", daemon=True)
+        self._thread.start()
+
+    def _acquire_single_worker(self) -> None:
+        workers = int(os.getenv("WEB_CONCURRENCY", "1") or "1")
+        if workers > 1:
+            raise RuntimeError(
+                f"SCAN_GROUP_COMMIT=1 exige un seul worker (WEB_CONCURRENCY={workers})"
+            )
+        if not self._lock_journal():
+            raise RuntimeError(
+                "SCAN_GROUP_COMMIT=1 exige un seul worker : le journal de scan "
+                f"{self.log_path} est déjà utilisé par un autre process"
+            )
+
+    def _lock_journal(self) -> bool:
+        """Verrou exclusif du journal (SCAN_LOG_PATH.lock), sans attendre. False s'il est pris."""
+        if fcntl is None:
+            return True
+        lock_file = open(self.log_path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _unlock_journal(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()  # libère le verrou
+            self._lock_file = None
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+        with self._lock:
+            self._log.close()
+            self._log = None
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) == 0:
+            os.remove(self.log_path)
+        self._unlock_journal()
+
+    # ---------- chemin du scan ----------
+
+    def scan(
+        self,
+        token: str,
+        expected_event_id: Optional[int],
+        loader: Callable[[], Optional[TicketState]],
+        gate: Optional[str] = None,
+    ) -> Tuple[Optional[TicketState], Optional[str]]:
+        """
+        Renvoie (état du ticket, raison du refus). Raison None = scan accepté.
+        `loader` lit le ticket en base ; il n'est appelé que si le token n'est pas en mémoire.
+        """
+        state = self._tickets.get(token)
+        if state is None:
+            # lecture en base hors verrou pour ne pas sérialiser les scans sur le disque
+            loaded = loader()
+            if loaded is None:
+                return None, "ticket_not_found"
+            with self._lock:
+                state = self._tickets.setdefault(token, loaded)
+
+        with self._lock:
+            state = self._tickets[token]
+            if expected_event_id is not None and state.event_id != expected_event_id:
+                return state, "wrong_event"
+            if state.status == "SCANNED":
+                return state, "already_scanned"
+            if state.status != "UNUSED":
+                return state, "invalid_status"
+
+            scanned_at = datetime.utcnow()
+            state = replace(state, status="SCANNED", scanned_at=scanned_at)
+            self._tickets[token] = state
+            # la porte est journalisée pour les agrégats de présence (rollups.py)
+            gate_field = (gate or "").replace("\t", " ").replace("\n", " ")
+            self._log.write(f"{token}\t{scanned_at.isoformat()}\t{gate_field}\n")
+            self._log.flush()
+            if SCAN_LOG_FSYNC == "each":
+                os.fsync(self._log.fileno())
+            self._pending.append((token, scanned_at, gate))
+            self._pinned.add(token)
+            return state, None
+
+    def forget(self, token: str) -> None:
+        """À appeler quand un ticket est modifié / supprimé hors du scan."""
+        with self._lock:
+            self._forget(token)
+
+    def forget_event(self, event_id: int) -> None:
+        """À appeler quand un event est supprimé / archivé : oublie tous ses tickets."""
+        with self._lock:
+            for token in [t for t, s in self._tickets.items() if s.event_id == event_id]:
+                self._forget(token)
+
+    def _forget(self, token: str) -> None:
+        # scan pas encore commité : relire la base le ferait accepter une 2e fois
+        if token in self._pinned:
+            self._forget_later.add(token)
+        else:
+            self._tickets.pop(token, None)
+
+    def _unpin(self, batch: List[PendingScan]) -> None:
+        """Scans commités en base : les tokens peuvent de nouveau être oubliés."""
+        with self._lock:
+            for token, _, _ in batch:
+                self._pinned.discard(token)
+                if token in self._forget_later:
+                    self._forget_later.discard(token)
+                    self._tickets.pop(token, None)
+
+    # ---------- écriture en base ----------
+
+    def _write_batch(self, batch: List[PendingScan]) -> None:
+        stmt = (
+            update(models.Ticket.__table__)
+            .where(
+                models.Ticket.__table__.c.qr_code_token == bindparam("token"),
+                models.Ticket.__table__.c.status == "UNUSED",
+            )
+            .values(status="SCANNED", scanned_at=bindparam("scanned"))
+            .returning(models.Ticket.__table__.c.event_id)
+        )
+        with engine.begin() as conn:
+            applied = []
+            # une requête par scan (même transaction) : seuls les tickets réellement
+            # passés à SCANNED sont comptés, le rejeu d'un journal ne compte rien deux fois
+            for token, scanned_at, gate in batch:
+                event_id = conn.execute(stmt, {"token": token, "scanned": scanned_at}).scalar()
+                if event_id is not None:
+                    applied.append(
+                        {"event_id": event_id, "token": token, "scanned_at": scanned_at, "gate": gate}
+                    )
+            record_scans(conn, applied)
+
+    def _retry_failed(self) -> None:
+        while self._failed:
+            path, batch = self._failed[0]
+            try:
+                self._write_batch(batch)
+            except Exception:
+                logger.exception("Nouvel échec d'écriture des scans de %s", path)
+                return
+            os.remove(path)
+            self._failed.pop(0)
+            self._unpin(batch)
+            logger.info("Segment de scans réécrit : %s (%s scans)", path, len(batch))
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            # segments en échec d'abord : l'ordre des scans est conservé
+            self._retry_failed()
+            with self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                # rotation du journal : le segment en cours correspond exactement à `batch`
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self._log.close()
+                os.replace(self.log_path, self.flushing_path)
+                self._log = open(self.log_path, "a", encoding="utf-8")
+
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # segment gardé (tokens toujours épinglés) : retenté au prochain flush,
+                # rejoué au prochain démarrage si le process s'arrête avant
+                logger.exception("Écriture des scans en base impossible (%s scans)", len(batch))
+                failed_path = f"{self.flushing_path}.{datetime.utcnow():%Y%m%d%H%M%S%f}"
+                os.replace(self.flushing_path, failed_path)
+                self._failed.append((failed_path, batch))
+                return
+            os.remove(self.flushing_path)
+            self._unpin(batch)
+
+    def _flush_loop(self) -> None:
+        interval = SCAN_FLUSH_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Erreur dans le flush des scans")
+
+    def _replay_logs(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.log_path))
+        prefix = os.path.basename(self.log_path)
+        paths = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.startswith(prefix) and not name.endswith(".lock")
+        )
+        for path in paths:
+            batch = []
+            try:
+                with open(path, encoding="utf-8") as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                continue  # déjà rejoué (plateforme sans verrou)
+            for number, line in enumerate(lines, start=1):
+                # anciens journaux : pas de 3e colonne (porte)
+                token, scanned, gate = (line.rstrip("\n").split("\t") + ["", ""])[:3]
+                try:
+                    if not token or not scanned:
+                        raise ValueError("colonne manquante")
+                    scanned_at = datetime.fromisoformat(scanned)
+                except ValueError:
+                    # ligne tronquée par un crash en cours d'écriture (même au milieu de la date)
+                    logger.warning("Ligne %s illisible ignorée dans %s : %r", number, path, line)
+                    continue
+                batch.append((token, scanned_at, gate or None))
+            if batch:
+                # idempotent : un ticket déjà SCANNED n'est pas modifié
+                self._write_batch(batch)
+                logger.info("Journal de scan rejoué : %s (%s scans)", path, len(batch))
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+scan_store = ScanStore()
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 # ==========================
 # USERS / AUTH
@@ -33,6 +33,9 @@ class EventBase(BaseModel):
     description: Optional[str] = None
     date: datetime
     location: str
+    # modèle du mail envoyé aux participants ($first_name, $last_name, $event_name...)
+    email_subject: Optional[str] = None
+    email_template: Optional[str] = None
 
 class EventCreate(EventBase):
     """Données reçues pour créer un event"""
@@ -46,6 +49,25 @@ class EventOut(EventBase):
         orm_mode = True  # permet de retourner des objets SQLAlchemy
 
 
+class QuotaSet(BaseModel):
+    """Capacité de l'event (tarif absent) ou quota d'un tarif ; capacity null = sans limite"""
+    tarif: Optional[str] = None
+    capacity: Optional[int] = Field(None, ge=0)
+
+
+class QuotaOut(BaseModel):
+    tarif: Optional[str] = None     # None = capacité totale de l'event
+    capacity: int
+    used: int
+    remaining: int
+
+
+class ArchiveResult(BaseModel):
+    """Résultat d'un archivage : lignes déplacées par table"""
+    cutoff: datetime
+    moved: Dict[str, int]
+
+
 # ==========================
 # TICKETS
 # ==========================
@@ -71,11 +93,14 @@ class TicketOut(BaseModel):
 
 class ScanRequest(BaseModel):
     token: str
+    event_id: Optional[int] = None  # event du scanner : refuse les tickets d'un autre event
+    device_id: Optional[str] = None  # identifiant du téléphone / scanner (audit)
+    gate: Optional[str] = None       # porte d'entrée (audit)
 
 
 class ScanResult(BaseModel):
     valid: bool          # True si le ticket est accepté
-    reason: Optional[str] = None  # ex: "ticket_not_found", "already_scanned"
+    reason: Optional[str] = None  # ex: "ticket_not_found", "already_scanned", "invalid_signature", "wrong_event"
     user_email: Optional[str] = None
     user_name: Optional[str] = None
     event_id: Optional[int] = None
@@ -125,6 +150,21 @@ class ParticipantUpdate(BaseModel):
     tarif: Optional[str] = None
 
 
+class EnrollRequest(BaseModel):
+    """Filtres sur l'annuaire des étudiants (combinés en ET)"""
+    student_ids: Optional[List[int]] = None
+    email_domain: Optional[str] = None    # ex: "eleves.enpc.fr"
+    is_external: Optional[bool] = None
+    q: Optional[str] = None               # fragment de nom, prénom ou email
+    promo: Optional[str] = None           # appliqués à tous les inscrits
+    tarif: Optional[str] = None
+
+
+class EnrollResult(BaseModel):
+    enrolled: int
+    skipped_already_enrolled: int
+
+
 class ParticipantOut(ParticipantBase):
     id: int
     event_id: int
@@ -134,3 +174,204 @@ class ParticipantOut(ParticipantBase):
 
     class Config:
         orm_mode = True
+
+
+# ==========================
+# JOBS (tâches en arrière-plan)
+# ==========================
+
+class JobSubmit(BaseModel):
+    kind: str
+    payload: Dict[str, Any] = {}
+    priority: int = 0
+
+
+class StudentsImportJob(BaseModel):
+    """Payload du job import_students_csv : contenu brut du fichier CSV"""
+    content: str
+
+
+class TicketsBulkJob(TicketsBulkCreate):
+    """Payload du job create_tickets_bulk"""
+    event_id: int
+
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: str
+    priority: int
+    processed: int = 0
+    total: Optional[int] = None
+    progress: Optional[float] = None      # entre 0 et 1
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+# ==========================
+# MAILS
+# ==========================
+
+class MailSendRequest(BaseModel):
+    participant_ids: Optional[List[int]] = None   # None = tous les participants avec un email
+    resend: bool = False                          # renvoyer aussi à ceux qui l'ont déjà reçu
+
+
+class MailSendResult(BaseModel):
+    queued: int
+    skipped_without_email: int
+    skipped_already_sent: int
+
+
+class EmailDeliveryOut(BaseModel):
+    participant_id: int
+    email: str
+    status: str
+    attempts: int
+    last_error: Optional[str] = None
+    sent_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
+class MailStatus(BaseModel):
+    counts: Dict[str, int]
+    deliveries: List[EmailDeliveryOut]
+
+
+class GateStats(BaseModel):
+    gate: Optional[str] = None
+    total: int
+    accepted: int
+    rejected: int
+    rejection_rate: float
+    per_minute: float
+    avg_latency_ms: Optional[float] = None
+
+
+class GateBucket(BaseModel):
+    bucket_start: datetime
+    gate: Optional[str] = None
+    total: int
+    accepted: int
+    rejected: int
+    rejection_rate: float
+
+
+class ScanStats(BaseModel):
+    since: datetime
+    until: datetime
+    gates: List[GateStats]
+    timeline: List[GateBucket]
+    reasons: Dict[str, int]
+
+
+class ScanKeys(BaseModel):
+    """Clés de vérification hors ligne des tokens signés d'un event"""
+    event_id: int
+    token_version: str
+    mac_bytes: int
+    current_kid: str
+    keys: Dict[str, str]   # kid -> clé de l'event (base64url)
+
+
+# ==========================
+# ANALYTICS (agrégats de présence)
+# ==========================
+
+class AttendancePoint(BaseModel):
+    bucket_start: datetime
+    key: Optional[str] = None      # porte ou tarif selon group_by
+    scans: int
+    per_minute: float
+    cumulative: int                # entrées depuis le début de l'event
+
+
+class AttendanceTimeline(BaseModel):
+    event_id: int
+    bucket_minutes: int
+    group_by: Optional[str] = None
+    points: List[AttendancePoint]
+
+
+class AttendanceCount(BaseModel):
+    key: Optional[str] = None
+    scans: int
+
+
+class PeakMinute(BaseModel):
+    minute: datetime
+    scans: int
+
+
+class PeakWindow(BaseModel):
+    start: datetime
+    minutes: int
+    scans: int
+
+
+class AttendanceSummary(BaseModel):
+    event_id: int
+    total: int
+    first_minute: Optional[datetime] = None
+    last_minute: Optional[datetime] = None
+    peak_minutes: List[PeakMinute]
+    peak_window: Optional[PeakWindow] = None
+    by_gate: List[AttendanceCount]
+    by_tarif: List[AttendanceCount]
+
+
+class CurvePoint(BaseModel):
+    offset_minutes: int            # depuis le début de l'event (négatif = en avance)
+    scans: int
+    cumulative: int
+    cumulative_ratio: float
+
+
+class EventCurve(BaseModel):
+    event_id: int
+    name: Optional[str] = None
+    date: Optional[datetime] = None
+    total: int
+    points: List[CurvePoint]
+
+
+# ==========================
+# DOUBLONS (étudiants, participants)
+# ==========================
+
+class DuplicateMember(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    email: Optional[str] = None
+
+
+class DuplicateMatch(DuplicateMember):
+    score: float
+
+
+class StudentCreated(Student):
+    # fiches ressemblantes déjà en base : simple avertissement, la fiche est créée
+    possible_duplicates: List[DuplicateMatch] = []
+
+
+class ParticipantCreated(ParticipantOut):
+    possible_duplicates: List[DuplicateMatch] = []
+
+
+class DuplicateGroup(BaseModel):
+    score: float                   # meilleur score entre deux fiches du groupe (0 à 1)
+    reasons: List[str]             # "email", "nom", "alias email"
+    members: List[DuplicateMember]
+
+
+class DuplicateReport(BaseModel):
+    scanned: int                   # fiches lues
+    pairs_compared: int            # paires scorées (après blocage)
+    groups: List[DuplicateGroup]
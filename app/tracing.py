@@ -0,0 +1,262 @@
+"""
+Traces des requêtes : où passe le temps d'un appel lent (décodage du JWT,
+attente / exécution SQL, commit, code de la route, sérialisation, envoi).
+
+Une trace = une requête échantillonnée (TRACE_SAMPLE_RATE, 0 = désactivé) ; elle
+contient des spans imbriqués :
+
+    request GET /events/{event_id}/participants/
+      ├─ dependencies ─ jwt.decode, get_current_user ─ sql SELECT
+      ├─ endpoint ─ sql SELECT ...
+      ├─ serialize
+      ├─ db.commit
+      └─ send
+
+Les spans SQL viennent des événements de l'engine (un span par requête), les
+autres de `span("nom")` dans le code et de l'instrumentation de FastAPI
+(`instrument_fastapi`). Le span courant est porté par une ContextVar : les routes
+et dépendances synchrones (exécutées dans le threadpool) héritent du contexte.
+
+Chaque trace terminée est écrite sur une ligne JSON de TRACE_PATH. Hors
+échantillon, `span()` et les hooks SQL se limitent à lire la ContextVar.
+Résumé des traces : `python scripts/trace_summary.py`.
+"""
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_PATH = os.getenv("TRACE_PATH", "./traces.jsonl")
+# longueur max d'une requête SQL recopiée dans un span
+MAX_STATEMENT_LENGTH = 300
+
+
+class Span:
+    __slots__ = ("trace", "id", "parent_id", "name", "start", "end", "attrs")
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.trace = trace
+        self.id = trace.next_id()
+        self.parent_id = parent.id if parent is not None else None
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+    def finish(self) -> None:
+        self.end = time.perf_counter()
+        self.trace.spans.append(self)
+
+    def to_dict(self) -> dict:
+        origin = self.trace.start
+        return {
+            "id": self.id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(((self.end or self.start) - self.start) * 1000, 3),
+            **({"attrs": self.attrs} if self.attrs else {}),
+        }
+
+
+class Trace:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        # spans créés depuis plusieurs threads (threadpool de FastAPI)
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def start_span(name: str, **attrs) -> Optional[Span]:
+    """Ouvre un span enfant du span courant (None hors trace). À fermer par finish()."""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent, attrs)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """`with span("nom"):` mesure le bloc (rien à faire si la requête n'est pas tracée)."""
+    current = start_span(name, **attrs)
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+class TraceExporter:
+    """Écrit les traces terminées dans un fichier JSONL (une trace par ligne)."""
+
+    def __init__(self, path: str = TRACE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, trace: Trace, root: Span) -> None:
+        line = json.dumps(
+            {
+                "trace_id": trace.id,
+                "started_at": trace.started_at.isoformat(),
+                "name": root.name,
+                "duration_ms": round((root.end - root.start) * 1000, 3),
+                **root.attrs,
+                "spans": [s.to_dict() for s in sorted(trace.spans, key=lambda s: s.start)],
+            },
+            default=str,
+        )
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+exporter = TraceExporter()
+
+
+class TracingMiddleware:
+    """Middleware ASGI : ouvre la trace des requêtes échantillonnées, mesure l'envoi."""
+
+    def __init__(self, app: ASGIApp, sample_rate: float = TRACE_SAMPLE_RATE, exporter: TraceExporter = exporter):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        root = Span(trace, "request", None, {"method": scope["method"], "path": scope["path"]})
+        token = _current_span.set(root)
+        sending: Optional[Span] = None
+
+        async def traced_send(message: Message) -> None:
+            nonlocal sending
+            if message["type"] == "http.response.start":
+                root.attrs["status"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-trace-id", trace.id.encode())]
+                sending = Span(trace, "send", root, {})
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                if sending is not None and sending.end is None:
+                    sending.finish()
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            _current_span.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                # chemin de la route (/events/{event_id}/...) : regroupement dans le résumé
+                root.attrs["route"] = route.path
+            root.end = time.perf_counter()
+            self.exporter.export(trace, root)
+
+
+# ---------- SQL ----------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    current = start_span(
+        "sql",
+        kind=statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "",
+        statement=statement[:MAX_STATEMENT_LENGTH],
+        **({"executemany": True} if executemany else {}),
+    )
+    if current is not None:
+        conn.info.setdefault("trace_spans", []).append(current)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        current = spans.pop()
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            current.attrs["rows"] = cursor.rowcount
+        current.finish()
+
+
+def _handle_error(exception_context):
+    spans = exception_context.connection.info.get("trace_spans") if exception_context.connection else None
+    if spans:
+        current = spans.pop()
+        current.attrs["error"] = type(exception_context.original_exception).__name__
+        current.finish()
+
+
+def instrument_engine(engine) -> None:
+    """Un span par requête SQL exécutée sur `engine`."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# ---------- FastAPI ----------
+
+def instrument_fastapi() -> None:
+    """
+    Spans autour de la résolution des dépendances ("dependencies" : get_db,
+    get_current_user...), de l'appel de la route ("endpoint") et de la validation /
+    sérialisation de la réponse par Pydantic ("serialize"). FastAPI n'a pas de
+    point d'extension pour ces étapes : on enveloppe ses fonctions internes
+    (appelées par leur nom global dans fastapi.routing).
+    """
+    import fastapi.routing as routing
+
+    if getattr(routing.run_endpoint_function, "__traced__", False):
+        return
+    solve_dependencies = routing.solve_dependencies
+    run_endpoint_function = routing.run_endpoint_function
+    serialize_response = routing.serialize_response
+
+    async def traced_solve_dependencies(*args, **kwargs):
+        with span("dependencies"):
+            return await solve_dependencies(*args, **kwargs)
+
+    async def traced_run_endpoint_function(*args, **kwargs):
+        with span("endpoint"):
+            return await run_endpoint_function(*args, **kwargs)
+
+    async def traced_serialize_response(*args, **kwargs):
+        with span("serialize"):
+            return await serialize_response(*args, **kwargs)
+
+    traced_run_endpoint_function.__traced__ = True
+    routing.solve_dependencies = traced_solve_dependencies
+    routing.run_endpoint_function = traced_run_endpoint_function
+    routing.serialize_response = traced_serialize_response
@@ -0,0 +1,175 @@
+"""
+Benchmark des routes de liste : chemin ORM (objets + from_orm) contre chemin
+Core (select() sur les colonnes utiles -> dicts), cf. app/queries.py.
+
+Mesure, pour chaque liste, le temps CPU par ligne (requête + sérialisation
+Pydantic) et le pic mémoire Python (tracemalloc).
+
+Usage (depuis la racine du dépôt) :
+    python scripts/bench_reads.py --rows 20000 --repeat 5
+
+La base de test est créée dans un dossier temporaire : app.db n'est pas touchée.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# DATABASE_URL est relatif au dossier courant
+os.chdir(tempfile.mkdtemp(prefix="bench_reads_"))
+
+from sqlalchemy import insert  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.db import Base, SessionLocal, engine  # noqa: E402
+from app import models, schemas  # noqa: E402
+from app.queries import (  # noqa: E402
+    PARTICIPANT_COLUMNS,
+    TICKET_COLUMNS,
+    event_select,
+    participant_select,
+    rows_as_dicts,
+    student_select,
+    ticket_select,
+)
+
+EVENT_ID = 1
+
+
+def populate(rows: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(
+            insert(models.Event.__table__),
+            [{"id": i, "name": f"Event {i}", "date": now, "location": "Paris"} for i in range(1, rows + 1)],
+        )
+        conn.execute(
+            insert(models.Student.__table__),
+            [
+                {"first_name": f"F{i}", "last_name": f"L{i}", "email": f"s{i}@eleves.enpc.fr", "is_external": False}
+                for i in range(rows)
+            ],
+        )
+        conn.execute(
+            insert(models.Participant.__table__),
+            [
+                {"event_id": EVENT_ID, "first_name": f"F{i}", "last_name": f"L{i}",
+                 "email": f"p{i}@a.fr", "tarif": "A", "promo": "2025", "qr_code": f"tok{i}"}
+                for i in range(rows)
+            ],
+        )
+        conn.execute(
+            insert(models.Ticket.__table__),
+            [
+                {"event_id": EVENT_ID, "user_email": f"p{i}@a.fr", "user_name": f"F{i} L{i}",
+                 "qr_code_token": f"tok{i}", "status": "UNUSED"}
+                for i in range(rows)
+            ],
+        )
+
+
+# ---------- ancien chemin : objets ORM ----------
+
+def orm_participants(db):
+    participants = (
+        db.query(models.Participant)
+        .filter(models.Participant.event_id == EVENT_ID)
+        .order_by(models.Participant.last_name)
+        .all()
+    )
+    tickets = db.query(models.Ticket).filter(
+        models.Ticket.qr_code_token.in_([p.qr_code for p in participants])
+    ).all()
+    tickets_by_qr = {t.qr_code_token: t for t in tickets}
+    out = []
+    for p in participants:
+        ticket = tickets_by_qr.get(p.qr_code)
+        out.append(schemas.ParticipantOut(
+            id=p.id, event_id=p.event_id, first_name=p.first_name, last_name=p.last_name,
+            promo=p.promo, email=p.email, tarif=p.tarif, qr_code=p.qr_code,
+            status=ticket.status if ticket else None,
+            scanned_at=ticket.scanned_at if ticket else None,
+        ))
+    return out
+
+
+def orm_list(model, schema, **filters):
+    def run(db):
+        objects = db.query(model).filter_by(**filters).all()
+        return TypeAdapter(list[schema]).validate_python(objects, from_attributes=True)
+    return run
+
+
+# ---------- nouveau chemin : Core ----------
+
+def core_list(stmt_factory, schema):
+    def run(db):
+        return TypeAdapter(list[schema]).validate_python(rows_as_dicts(db.execute(stmt_factory())))
+    return run
+
+
+CASES = [
+    (
+        "participants",
+        orm_participants,
+        core_list(lambda: participant_select(EVENT_ID, list(PARTICIPANT_COLUMNS)), schemas.ParticipantOut),
+    ),
+    (
+        "tickets",
+        orm_list(models.Ticket, schemas.TicketOut, event_id=EVENT_ID),
+        core_list(lambda: ticket_select(EVENT_ID, list(TICKET_COLUMNS)), schemas.TicketOut),
+    ),
+    (
+        "students",
+        orm_list(models.Student, schemas.Student),
+        core_list(student_select, schemas.Student),
+    ),
+    (
+        "events",
+        orm_list(models.Event, schemas.EventOut),
+        core_list(event_select, schemas.EventOut),
+    ),
+]
+
+
+def measure(run, repeat: int):
+    """(µs CPU par ligne, meilleur essai ; pic mémoire en Mo ; nb de lignes)"""
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        with SessionLocal() as db:
+            started = time.process_time()
+            rows = len(run(db))
+            elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    with SessionLocal() as db:
+        tracemalloc.start()
+        run(db)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return best / max(rows, 1) * 1e6, peak / 1024 / 1024, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    populate(args.rows)
+    print(f"{'liste':<14}{'chemin':<8}{'lignes':>8}{'µs CPU/ligne':>15}{'pic mémoire (Mo)':>19}")
+    for name, orm_run, core_run in CASES:
+        for label, run in (("orm", orm_run), ("core", core_run)):
+            cpu, peak, rows = measure(run, args.repeat)
+            print(f"{name:<14}{label:<8}{rows:>8}{cpu:>15.2f}{peak:>19.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Résumé des traces écrites par app/tracing.py (TRACE_SAMPLE_RATE > 0).
+
+Affiche :
+    - par route : nombre de traces, p50 / p95 / max ;
+    - les traces les plus lentes et, pour chacune, où est passé le temps
+      (temps propre de chaque étape, enfants déduits ; SQL par type de requête) ;
+    - les requêtes SQL les plus longues de ces traces.
+
+Usage (depuis la racine du dépôt) :
+    python scripts/trace_summary.py traces.jsonl --top 10 --route /scan
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+
+def load_traces(path, route=None):
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                trace = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # ligne tronquée (arrêt brutal du serveur)
+            label = trace.get("route") or trace.get("path", "")
+            if route and route not in label:
+                continue
+            traces.append(trace)
+    return traces
+
+
+def _label(trace):
+    return f'{trace.get("method", "")} {trace.get("route") or trace.get("path", "")}'
+
+
+def _category(span):
+    if span["name"] == "sql":
+        return f'sql {span.get("attrs", {}).get("kind", "")}'.strip()
+    return span["name"]
+
+
+def self_times(trace):
+    """Temps propre par étape (durée du span moins celle de ses enfants directs), en ms."""
+    children = defaultdict(float)
+    for span in trace["spans"]:
+        if span["parent_id"] is not None:
+            children[span["parent_id"]] += span["duration_ms"]
+
+    times = defaultdict(float)
+    root_children = 0.0
+    for span in trace["spans"]:
+        times[_category(span)] += max(span["duration_ms"] - children[span["id"]], 0.0)
+        if span["parent_id"] == 1:
+            root_children += span["duration_ms"]
+    # le span racine (id 1) n'est pas dans la liste : le reste = middlewares, routage
+    times["(middlewares, routage)"] += max(trace["duration_ms"] - root_children, 0.0)
+    return times
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default="traces.jsonl")
+    parser.add_argument("--top", type=int, default=10, help="nombre de traces lentes détaillées")
+    parser.add_argument("--route", help="ne garder que les routes qui contiennent ce texte")
+    args = parser.parse_args(argv)
+
+    traces = load_traces(args.path, args.route)
+    if not traces:
+        print("Aucune trace.")
+        return 1
+
+    by_route = defaultdict(list)
+    for trace in traces:
+        by_route[_label(trace)].append(trace["duration_ms"])
+    print(f"{len(traces)} traces\n")
+    print(f'{"route":<50} {"n":>6} {"p50 ms":>9} {"p95 ms":>9} {"max ms":>9}')
+    for label, durations in sorted(by_route.items(), key=lambda item: -_percentile(item[1], 0.95)):
+        print(
+            f"{label[:50]:<50} {len(durations):>6} {_percentile(durations, 0.5):>9.2f} "
+            f"{_percentile(durations, 0.95):>9.2f} {max(durations):>9.2f}"
+        )
+
+    slowest = sorted(traces, key=lambda t: -t["duration_ms"])[:args.top]
+    total = defaultdict(float)
+    print(f"\n{len(slowest)} traces les plus lentes")
+    for trace in slowest:
+        times = self_times(trace)
+        for category, ms in times.items():
+            total[category] += ms
+        print(f'\n{trace["duration_ms"]:9.2f} ms  {_label(trace)}  {trace.get("status", "")}  {trace["trace_id"]}')
+        for category, ms in sorted(times.items(), key=lambda item: -item[1]):
+            if ms >= 0.01:
+                print(f'    {category:<28} {ms:9.2f} ms  {100 * ms / trace["duration_ms"]:5.1f} %')
+
+    overall = sum(total.values()) or 1.0
+    print("\nRépartition cumulée (traces lentes)")
+    for category, ms in sorted(total.items(), key=lambda item: -item[1]):
+        print(f"    {category:<28} {ms:9.2f} ms  {100 * ms / overall:5.1f} %")
+
+    statements = [
+        (span["duration_ms"], span.get("attrs", {}).get("statement", ""))
+        for trace in slowest
+        for span in trace["spans"]
+        if span["name"] == "sql"
+    ]
+    if statements:
+        print("\nRequêtes SQL les plus longues")
+        for ms, statement in sorted(statements, key=lambda item: -item[0])[:5]:
+            print(f"    {ms:9.2f} ms  {' '.join(statement.split())[:120]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
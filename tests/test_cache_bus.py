@@ -0,0 +1,119 @@
+"""
+Invalidation des caches locaux entre plusieurs process (cf. app/cache_bus.py).
+
+Plusieurs process partagent un même fichier SQLite, comme des workers uvicorn :
+les lecteurs remplissent leurs caches d'utilisateurs et d'events, un autre
+process modifie les lignes puis appelle `cache_bus.bump` ; les lecteurs doivent
+alors relire la base.
+
+    python -m pytest tests
+"""
+import multiprocessing
+import os
+import time
+
+READERS = 3
+TIMEOUT = 20
+# au-delà de CACHE_BUS_POLL_MS (50 ms) : le bus a forcément été relu
+SETTLE_SECONDS = 0.3
+
+
+def _setup(workdir):
+    os.chdir(workdir)  # DATABASE_URL est relatif (./app.db)
+    from app.db import Base, SessionLocal, engine
+    from app import models
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        user = models.User(email="u@tdlog.local", name="avant", hashed_password="x", is_superadmin=False)
+        db.add(user)
+        db.flush()
+        db.add(models.Event(name="avant", created_by_id=user.id))
+        db.commit()
+
+
+def _read(db):
+    from app.deps import get_user_by_id
+    from app.routers.events import get_event
+
+    return get_user_by_id(1, db).name, get_event(1, db)["name"]
+
+
+def _reader(workdir, barrier, results):
+    os.chdir(workdir)
+    from app.db import SessionLocal
+    from app.deps import _user_cache
+    from app.routers.events import _event_cache
+
+    with SessionLocal() as db:
+        _read(db)
+    barrier.wait(TIMEOUT)  # caches remplis
+
+    barrier.wait(TIMEOUT)  # lignes modifiées sans bump
+    time.sleep(SETTLE_SECONDS)
+    with SessionLocal() as db:
+        stale = _read(db)
+    served_from_cache = _user_cache.hits > 0 and _event_cache.hits > 0
+    barrier.wait(TIMEOUT)
+
+    barrier.wait(TIMEOUT)  # bump commité par un autre process
+    deadline = time.monotonic() + 5
+    while True:
+        with SessionLocal() as db:
+            fresh = _read(db)
+        if fresh == ("après", "après") or time.monotonic() > deadline:
+            break
+        time.sleep(0.01)
+    results.put((stale, served_from_cache, fresh))
+
+
+def _writer(workdir, barrier):
+    os.chdir(workdir)
+    from sqlalchemy import text
+
+    from app.cache_bus import cache_bus
+    from app.db import SessionLocal
+
+    barrier.wait(TIMEOUT)
+    with SessionLocal() as db:
+        # modification "à la main" : sans bump, les caches des lecteurs restent valides
+        db.execute(text("UPDATE users SET name = 'après' WHERE id = 1"))
+        db.execute(text("UPDATE events SET name = 'après' WHERE id = 1"))
+        db.commit()
+    barrier.wait(TIMEOUT)
+    barrier.wait(TIMEOUT)
+
+    with SessionLocal() as db:
+        cache_bus.bump(db, "users", "events")
+        db.commit()
+    barrier.wait(TIMEOUT)
+
+
+def test_bump_invalidates_caches_of_other_processes(tmp_path):
+    context = multiprocessing.get_context("spawn")  # process neufs, comme des workers
+    workdir = str(tmp_path)
+
+    setup = context.Process(target=_setup, args=(workdir,))
+    setup.start()
+    setup.join(TIMEOUT)
+    assert setup.exitcode == 0
+
+    barrier = context.Barrier(READERS + 1)
+    results = context.Queue()
+    processes = [context.Process(target=_reader, args=(workdir, barrier, results)) for _ in range(READERS)]
+    processes.append(context.Process(target=_writer, args=(workdir, barrier)))
+    for process in processes:
+        process.start()
+    try:
+        outcomes = [results.get(timeout=TIMEOUT) for _ in range(READERS)]
+    finally:
+        for process in processes:
+            process.join(TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+
+    assert all(process.exitcode == 0 for process in processes)
+    for stale, served_from_cache, fresh in outcomes:
+        assert served_from_cache
+        assert stale == ("avant", "avant")
+        assert fresh == ("après", "après")
@@ -0,0 +1,154 @@
+"""
+Envoi des mails (cf. app/mailer.py) vers un serveur SMTP local : statut SENT,
+échec temporaire retenté avec délai croissant, débit partagé entre process.
+
+    python -m pytest tests
+"""
+import threading
+import time
+import warnings
+from datetime import datetime, timedelta
+
+import pytest
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    asyncore = pytest.importorskip("asyncore")
+    smtpd = pytest.importorskip("smtpd")  # retiré de la stdlib en 3.12
+
+BACKOFF_SECONDS = 0.2
+
+
+class LocalSMTPServer(smtpd.SMTPServer):
+    """Accepte tout, sauf les premiers DATA destinés aux adresses de `failures` (451)."""
+
+    def __init__(self, failures=None):
+        super().__init__(("127.0.0.1", 0), None, decode_data=False)
+        self.port = self.socket.getsockname()[1]
+        self.failures = dict(failures or {})
+        self.received = []
+        self._thread = threading.Thread(target=asyncore.loop, kwargs={"timeout": 0.05}, daemon=True)
+        self._thread.start()
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        for rcpt in rcpttos:
+            if self.failures.get(rcpt):
+                self.failures[rcpt] -= 1
+                return "451 Try again later"  # réponse SMTP : ASCII
+        self.received.extend(rcpttos)
+        return None
+
+    def shutdown(self):
+        asyncore.close_all()
+        self._thread.join(5)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Base SQLite neuve dans tmp_path, utilisée par le mailer à la place de app.db."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db import Base
+    from app import mailer
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+    monkeypatch.setattr(mailer, "SessionLocal", SessionLocal)
+    monkeypatch.setattr(mailer, "MAIL_BACKOFF_SECONDS", BACKOFF_SECONDS)
+    yield SessionLocal
+    engine.dispose()
+
+
+def _enqueue(SessionLocal, *emails):
+    from app import models
+
+    with SessionLocal() as db:
+        event = models.Event(name="Gala")
+        db.add(event)
+        db.flush()
+        for i, email in enumerate(emails):
+            participant = models.Participant(
+                event_id=event.id, first_name="P", last_name=str(i), email=email, qr_code=f"qr-{i}"
+            )
+            db.add(participant)
+            db.flush()
+            db.add(models.EmailDelivery(
+                event_id=event.id, participant_id=participant.id, email=email,
+                subject="Billet", body="Bonjour", qr_code=participant.qr_code,
+                status="PENDING", attempts=0, created_at=datetime.utcnow(),
+            ))
+        db.commit()
+
+
+def _deliveries(SessionLocal):
+    from app import models
+
+    with SessionLocal() as db:
+        return {d.email: d for d in db.query(models.EmailDelivery)}
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    from app import mailer
+
+    server = LocalSMTPServer(failures={"later@tdlog.local": 2})
+    monkeypatch.setattr(mailer, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(mailer, "SMTP_PORT", server.port)
+    yield server
+    server.shutdown()
+
+
+def test_sent_then_retry_with_backoff(database, smtp_server):
+    from app.mailer import Mailer
+
+    _enqueue(database, "ok@tdlog.local", "later@tdlog.local")
+    sender = Mailer(senders=1)
+    try:
+        sender._send_batch(sender._claim_batch())
+        deliveries = _deliveries(database)
+        assert deliveries["ok@tdlog.local"].status == "SENT"
+        assert deliveries["ok@tdlog.local"].sent_at is not None
+        later = deliveries["later@tdlog.local"]
+        assert (later.status, later.attempts) == ("PENDING", 1)
+        assert "451" in later.last_error
+        first_delay = later.next_attempt_at - later.claimed_at
+        assert first_delay >= timedelta(seconds=BACKOFF_SECONDS)
+
+        # pas de nouvel essai avant la fin du délai
+        assert sender._claim_batch() == []
+        time.sleep(BACKOFF_SECONDS * 1.5)
+        sender._send_batch(sender._claim_batch())
+        later = _deliveries(database)["later@tdlog.local"]
+        assert (later.status, later.attempts) == ("PENDING", 2)
+        # délai exponentiel : le second est deux fois plus long que le premier
+        second_delay = later.next_attempt_at - later.claimed_at
+        assert second_delay >= timedelta(seconds=2 * BACKOFF_SECONDS)
+
+        time.sleep(BACKOFF_SECONDS * 2.5)
+        sender._send_batch(sender._claim_batch())
+        later = _deliveries(database)["later@tdlog.local"]
+        assert (later.status, later.attempts, later.last_error) == ("SENT", 3, None)
+        assert smtp_server.received == ["ok@tdlog.local", "later@tdlog.local"]
+    finally:
+        sender.pool.close_all()
+
+
+def test_rate_shared_between_processes(database, smtp_server, monkeypatch):
+    from app import mailer
+
+    monkeypatch.setattr(mailer, "MAIL_RATE_PER_MINUTE", 2)
+    _enqueue(database, "a@tdlog.local", "b@tdlog.local", "c@tdlog.local")
+    # deux Mailer distincts : chacun son seau à jetons, comme deux workers uvicorn
+    first, second = mailer.Mailer(senders=1), mailer.Mailer(senders=1)
+    try:
+        claimed = first._claim_batch()
+        assert len(claimed) == 2
+        assert second._claim_batch() == []
+        first._send_batch(claimed)
+        assert second._claim_batch() == []  # toujours dans la même minute
+    finally:
+        first.pool.close_all()
+    statuses = {email: d.status for email, d in _deliveries(database).items()}
+    assert statuses == {"a@tdlog.local": "SENT", "b@tdlog.local": "SENT", "c@tdlog.local": "PENDING"}
@@ -0,0 +1,73 @@
+"""
+Rejeu du journal du mode group commit (cf. app/scan_store.py) après un crash.
+
+    python -m pytest tests
+"""
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Base SQLite neuve dans tmp_path, utilisée par scan_store à la place de app.db."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db import Base
+    from app import models, scan_store
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(scan_store, "engine", engine)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+    with SessionLocal() as db:
+        event = models.Event(name="E")
+        db.add(event)
+        db.flush()
+        for token in ("tok-1", "tok-2"):
+            db.add(models.Ticket(event_id=event.id, qr_code_token=token, status="UNUSED"))
+        db.commit()
+    yield SessionLocal
+    engine.dispose()
+
+
+def test_replay_skips_line_truncated_by_crash(database, tmp_path):
+    from app import models
+    from app.scan_store import ScanStore
+
+    log_path = str(tmp_path / "scan_journal.log")
+    scanned_at = datetime(2026, 10, 19, 20, 0, 0)
+    with open(log_path + ".flushing", "w", encoding="utf-8") as f:
+        f.write(f"tok-1\t{scanned_at.isoformat()}\tN\n")
+        f.write("tok-2\t2026-10-1")  # crash au milieu de l'écriture de la date
+
+    store = ScanStore(log_path=log_path, enabled=False)
+    store.start()  # ne doit pas empêcher le démarrage
+
+    with database() as db:
+        status = dict(db.query(models.Ticket.qr_code_token, models.Ticket.status))
+        first = db.query(models.Ticket).filter(models.Ticket.qr_code_token == "tok-1").one()
+        assert first.scanned_at == scanned_at
+    assert status == {"tok-1": "SCANNED", "tok-2": "UNUSED"}
+    assert not (tmp_path / "scan_journal.log.flushing").exists()
+
+
+def test_replay_left_to_the_worker_holding_the_lock(database, tmp_path):
+    from app.scan_store import ScanStore
+
+    log_path = str(tmp_path / "scan_journal.log")
+    segment = tmp_path / "scan_journal.log.flushing"
+    segment.write_text("tok-1\t2026-10-19T20:00:00\tN\n", encoding="utf-8")
+
+    holder = ScanStore(log_path=log_path, enabled=False)
+    assert holder._lock_journal()
+    try:
+        # autre worker au même moment : ni rejeu ni erreur, le segment n'est pas touché
+        ScanStore(log_path=log_path, enabled=False).start()
+        assert segment.exists()
+    finally:
+        holder._unlock_journal()
+
+    ScanStore(log_path=log_path, enabled=False).start()
+    assert not segment.exists()